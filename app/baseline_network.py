@@ -0,0 +1,123 @@
+#!/usr/bin/python3
+"""
+Volcano InSAR Interpretation Workbench
+
+SBAS baseline network of a target: acquisitions and interferometric pairs
+
+SPDX-License-Identifier: MIT
+
+Copyright (C) 2021-2024 Government of Canada
+
+Authors:
+  - Drew Rotheram <drew.rotheram-clarke@nrcan-rncan.gc.ca>
+"""
+import numpy as np
+import pandas as pd
+
+
+def _components(count, first, second):
+    """
+    Connected component root of each of count nodes, given the node
+    indices of the edges (union-find with path halving).
+    """
+    parent = list(range(count))
+
+    def root(node):
+        while parent[node] != node:
+            parent[node] = parent[parent[node]]
+            node = parent[node]
+        return node
+
+    for a, b in zip(first.tolist(), second.tolist()):
+        root_a, root_b = root(a), root(b)
+        if root_a != root_b:
+            parent[max(root_a, root_b)] = min(root_a, root_b)
+    return np.array([root(node) for node in range(count)], dtype=np.intp)
+
+
+class BaselineNetwork:
+    """
+    Acquisitions (nodes) and interferometric pairs (edges) of a target.
+
+    nodes: date, bperp (NaN when not in the baseline file), degree (the
+    number of processed pairs) and component (connected component over
+    the processed pairs, numbered in date order).
+
+    edges: first_date, second_date, coherence (NaN when not processed),
+    temporal_baseline (days), first_bperp, second_bperp and
+    perpendicular_baseline.
+
+    Parameters:
+    - nodes (pd.DataFrame): The acquisitions, in date order.
+    - edges (pd.DataFrame): The pairs.
+    """
+
+    def __init__(self, nodes, edges):
+        self.nodes = nodes
+        self.edges = edges
+
+    @classmethod
+    def build(cls, df_baseline, df_coherence):
+        """
+        Build the network from the baseline (bperp_all) and coherence
+        (CoherenceMatrix.csv) frames.
+        """
+        bperp = df_baseline.drop_duplicates('second_date').set_index(
+            'second_date')['bperp']
+        dates = pd.DatetimeIndex(np.union1d(
+            bperp.index,
+            np.union1d(df_coherence.first_date, df_coherence.second_date)))
+        dates = dates.dropna()
+        dated = df_coherence.first_date.notna().to_numpy()
+        dated &= df_coherence.second_date.notna().to_numpy()
+        edges = df_coherence.loc[dated,
+                                 ['first_date', 'second_date', 'coherence']]
+        edges = edges.assign(
+            temporal_baseline=(edges.second_date - edges.first_date).dt.days,
+            first_bperp=bperp.reindex(edges.first_date).to_numpy(),
+            second_bperp=bperp.reindex(edges.second_date).to_numpy())
+        edges['perpendicular_baseline'] = edges.second_bperp.sub(
+            edges.first_bperp)
+        edges = edges.reset_index(drop=True)
+
+        processed = edges.loc[edges.coherence.notna()]
+        first = dates.get_indexer(processed.first_date)
+        second = dates.get_indexer(processed.second_date)
+        degree = np.bincount(np.concatenate((first, second)),
+                             minlength=len(dates))
+        roots = _components(len(dates), first, second)
+        nodes = pd.DataFrame({
+            'date': dates,
+            'bperp': bperp.reindex(dates).to_numpy(),
+            'degree': degree,
+            'component': pd.factorize(roots)[0],
+        })
+        return cls(nodes, edges)
+
+    def processed(self):
+        """Return the pairs with a coherence."""
+        return self.edges.loc[self.edges.coherence.notna()]
+
+    def orphans(self):
+        """Return the acquisitions that are in no processed pair."""
+        return self.nodes.loc[self.nodes.degree == 0]
+
+    def component_sizes(self):
+        """
+        Return the number of acquisitions in each connected component
+        with at least one processed pair, largest first.
+        """
+        connected = self.nodes.loc[self.nodes.degree > 0]
+        return connected.component.value_counts()
+
+    def stats(self):
+        """Return the size and connectivity of the network."""
+        sizes = self.component_sizes()
+        return {
+            'acquisitions': len(self.nodes),
+            'pairs': len(self.edges),
+            'processed': int(self.edges.coherence.count()),
+            'components': len(sizes),
+            'largest_component': int(sizes.max()) if len(sizes) else 0,
+            'orphans': int((self.nodes.degree == 0).sum()),
+        }
@@ -0,0 +1,305 @@
+#!/usr/bin/python3
+"""
+Volcano InSAR Interpretation Workbench
+
+Append-only per-target store of coherence pairs, ingested and loaded by
+delta
+
+SPDX-License-Identifier: MIT
+
+Copyright (C) 2021-2024 Government of Canada
+
+Authors:
+  - Drew Rotheram <drew.rotheram-clarke@nrcan-rncan.gc.ca>
+"""
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict, namedtuple
+
+import numpy as np
+import pandas as pd
+
+from compact_pairs import CompactPairs
+from global_variables import COHERENCE_STORE_MAX_SEGMENTS, LOADER_CACHE_ITEMS
+from loader_cache import file_stamp
+
+logger = logging.getLogger(__name__)
+
+MANIFEST = 'manifest.json'
+
+# a loaded store: its version, the segments it was built from, the pairs
+# and, to merge a delta without re-sorting, their keys in sorted order
+# with the position of each sorted key in pairs
+StoreState = namedtuple('StoreState',
+                        ['version', 'segments', 'pairs', 'keys', 'order'])
+
+
+def pair_keys(first_days, second_days):
+    """One int64 key per (first, second) pair of int32 day ordinals."""
+    high = first_days.astype(np.int64) << 32
+    return high | (second_days.astype(np.int64) & 0xFFFFFFFF)
+
+
+def _state(pairs):
+    keys = pair_keys(pairs.first_days, pairs.second_days)
+    order = np.argsort(keys, kind='stable')
+    return StoreState(None, [], pairs, keys[order], order)
+
+
+def _find(state, keys):
+    """Positions of keys in state.pairs, and which of them were found."""
+    at = np.searchsorted(state.keys, keys)
+    found = at < len(state.keys)
+    found[found] = state.keys[at[found]] == keys[found]
+    return at, found
+
+
+def merge(state, delta):
+    """
+    Return a new state with the pairs of delta updated or appended.
+
+    Only the delta is searched and sorted; the arrays of the state are
+    copied, not rebuilt.
+    """
+    keys = pair_keys(delta.first_days, delta.second_days)
+    at, found = _find(state, keys)
+    values = state.pairs.values.copy()
+    values[state.order[at[found]]] = delta.values[found]
+
+    new = np.flatnonzero(~found)
+    new = new[np.argsort(keys[new], kind='stable')]
+    count = len(state.pairs)
+    pairs = CompactPairs(
+        np.concatenate((state.pairs.first_days, delta.first_days[new])),
+        np.concatenate((state.pairs.second_days, delta.second_days[new])),
+        np.concatenate((values, delta.values[new])),
+        state.pairs.value_column)
+    sorted_keys = np.insert(state.keys, at[new], keys[new])
+    order = np.insert(state.order, at[new],
+                      np.arange(count, count + len(new)))
+    return state._replace(pairs=pairs, keys=sorted_keys, order=order)
+
+
+def changed_pairs(state, pairs):
+    """The pairs that are not in state, or have another value there."""
+    if state is None:
+        return pairs
+    keys = pair_keys(pairs.first_days, pairs.second_days)
+    at, found = _find(state, keys)
+    old = np.full(len(pairs), np.nan, dtype=np.float32)
+    old[found] = state.pairs.values[state.order[at[found]]]
+    same = (old == pairs.values) | (np.isnan(old) & np.isnan(pairs.values))
+    same &= found
+    changed = ~same
+    return CompactPairs(pairs.first_days[changed], pairs.second_days[changed],
+                        pairs.values[changed], pairs.value_column)
+
+
+def state_frame(state):
+    """The pairs of a state as a frame, in (first, second) date order."""
+    pairs = state.pairs
+    return CompactPairs(pairs.first_days[state.order],
+                        pairs.second_days[state.order],
+                        pairs.values[state.order],
+                        pairs.value_column).to_frame()
+
+
+class CoherenceStore:
+    """
+    Coherence pairs of a target as a series of Feather segments, each
+    holding the pairs that were new or changed when it was ingested, in
+    a directory with a manifest:
+
+        {"version": 3, "segments": [...], "source": [inode, mtime, size]}
+
+    The version is bumped by each ingest that changes pairs; source is
+    the stamp of the CoherenceMatrix.csv last ingested.
+
+    Parameters:
+    - directory (str): The store directory.
+    - max_segments (int): Segments kept before compacting into one.
+    """
+
+    def __init__(self, directory, max_segments=COHERENCE_STORE_MAX_SEGMENTS):
+        self.directory = directory
+        self.max_segments = max_segments
+
+    def manifest(self):
+        """Return the manifest, or None if there is no store."""
+        try:
+            with open(os.path.join(self.directory, MANIFEST),
+                      encoding='utf-8') as manifest_file:
+                return json.load(manifest_file)
+        except (OSError, ValueError):
+            return None
+
+    def _write_manifest(self, manifest):
+        path = os.path.join(self.directory, MANIFEST)
+        with open(f'{path}.tmp', 'w', encoding='utf-8') as manifest_file:
+            json.dump(manifest, manifest_file)
+        os.replace(f'{path}.tmp', path)
+
+    def _write_segment(self, name, pairs):
+        path = os.path.join(self.directory, name)
+        pd.DataFrame({
+            'first_day': pairs.first_days,
+            'second_day': pairs.second_days,
+            'value': pairs.values,
+        }).to_feather(f'{path}.tmp')
+        os.replace(f'{path}.tmp', path)
+
+    def _read_segment(self, name, value_column):
+        frame = pd.read_feather(os.path.join(self.directory, name))
+        return CompactPairs(frame['first_day'].to_numpy(),
+                            frame['second_day'].to_numpy(),
+                            frame['value'].to_numpy(), value_column)
+
+    def load(self, cached=None, manifest=None):
+        """
+        Return the StoreState of the store, or None if there is none.
+
+        A cached state of an earlier version is brought up to date by
+        reading only the segments written since, unless the store was
+        compacted in between.
+        """
+        if manifest is None:
+            manifest = self.manifest()
+        if manifest is None:
+            return None
+        segments = manifest['segments']
+        if cached is not None and cached.version == manifest['version']:
+            return cached
+        state = None
+        if cached is not None and segments[:len(cached.segments)] == list(
+                cached.segments):
+            state = cached
+            segments = segments[len(cached.segments):]
+        for name in segments:
+            delta = self._read_segment(name, 'coherence')
+            state = _state(delta) if state is None else merge(state, delta)
+        if state is None:
+            empty = np.empty(0, dtype=np.int32)
+            state = _state(CompactPairs(
+                empty, empty, np.empty(0, dtype=np.float32), 'coherence'))
+        return state._replace(version=manifest['version'],
+                              segments=list(manifest['segments']))
+
+    def ingest(self, frame, source, cached=None):
+        """
+        Add the pairs of a parsed CoherenceMatrix.csv that are new or
+        changed as a new segment, bumping the version.
+
+        Parameters:
+        - frame (pd.DataFrame): first_date, second_date and coherence.
+        - source (tuple): Stamp of the file the frame was parsed from.
+        - cached (StoreState): A loaded state of the store, if any.
+
+        Returns:
+        - int: The number of pairs added or changed.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        manifest = self.manifest() or {'version': 0, 'segments': []}
+        state = self.load(cached, manifest) if manifest['segments'] else None
+        pairs = CompactPairs.from_frame(frame, 'coherence', pack_flags=False)
+        delta = changed_pairs(state, pairs)
+        manifest['source'] = list(source) if source else None
+        if len(delta) == 0:
+            self._write_manifest(manifest)
+            return 0
+        version = manifest['version'] + 1
+        name = f'{version:06d}.feather'
+        self._write_segment(name, delta)
+        old_segments = manifest['segments']
+        manifest['segments'] = old_segments + [name]
+        manifest['version'] = version
+        if len(manifest['segments']) > self.max_segments:
+            merged = self.load(state, manifest)
+            name = f'{version:06d}-compact.feather'
+            self._write_segment(name, merged.pairs)
+            manifest['segments'] = [name]
+        self._write_manifest(manifest)
+        for old in set(old_segments + [f'{version:06d}.feather']) - set(
+                manifest['segments']):
+            os.remove(os.path.join(self.directory, old))
+        logger.info('%s: %d pairs added or changed, version %d',
+                    self.directory, len(delta), version)
+        return len(delta)
+
+
+class CoherenceStores:
+    """
+    Loaded states of the coherence stores, kept up to date by reading
+    only new segments.
+
+    Parameters:
+    - max_items (int): Number of stores kept loaded.
+    """
+
+    def __init__(self, max_items=LOADER_CACHE_ITEMS):
+        self.max_items = max_items
+        self._states = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _current_manifest(store, source_path):
+        manifest = store.manifest()
+        if manifest is None:
+            return None
+        source = manifest.get('source')
+        stamp = file_stamp(source_path)
+        if source is None or stamp is None or tuple(source) != stamp:
+            return None
+        return manifest
+
+    def version(self, directory, source_path):
+        """
+        Return the version of a store if it was ingested from the current
+        version of source_path, otherwise None.
+        """
+        manifest = self._current_manifest(CoherenceStore(directory),
+                                          source_path)
+        return None if manifest is None else manifest['version']
+
+    def current(self, directory, source_path, attempts=3):
+        """
+        Return the StoreState of a store if it was ingested from the
+        current version of source_path, otherwise None.
+
+        An ingest that compacts the store removes the segments it
+        replaced, so a load that started from the previous manifest can
+        find a segment gone: the manifest is then read again, up to
+        attempts times, before giving up with None.
+        """
+        store = CoherenceStore(directory)
+        with self._lock:
+            cached = self._states.get(directory)
+        for attempt in range(attempts):
+            manifest = self._current_manifest(store, source_path)
+            if manifest is None:
+                return None
+            try:
+                state = store.load(cached, manifest)
+                break
+            except OSError as exception:
+                logger.info('%s changed while loading (%s), attempt %d',
+                            directory, exception, attempt + 1)
+        else:
+            logger.warning('%s could not be loaded', directory)
+            return None
+        with self._lock:
+            self._states[directory] = state
+            self._states.move_to_end(directory)
+            while len(self._states) > self.max_items:
+                self._states.popitem(last=False)
+        return state
+
+    def ingest(self, directory, frame, source):
+        """Ingest a parsed coherence file into a store."""
+        with self._lock:
+            cached = self._states.get(directory)
+        return CoherenceStore(directory).ingest(frame, source, cached)
+
+
+coherence_stores = CoherenceStores()
@@ -0,0 +1,110 @@
+#!/usr/bin/python3
+"""
+Volcano InSAR Interpretation Workbench
+
+Compact in-memory layout of the coherence and InSAR pair tables kept in
+the loader cache
+
+SPDX-License-Identifier: MIT
+
+Copyright (C) 2021-2024 Government of Canada
+
+Authors:
+  - Drew Rotheram <drew.rotheram-clarke@nrcan-rncan.gc.ca>
+"""
+import numpy as np
+import pandas as pd
+
+from global_variables import COH_DECIMALS
+
+# day ordinal of a missing (NaT) date
+MISSING_DAY = np.iinfo(np.int32).min
+
+
+def to_days(dates):
+    """Days since 1970-01-01 of dates as int32, NaT as MISSING_DAY."""
+    days = dates.to_numpy(dtype='datetime64[D]')
+    ordinals = days.view(np.int64).astype(np.int32)
+    ordinals[np.isnat(days)] = MISSING_DAY
+    return ordinals
+
+
+def to_float32(values, decimals=COH_DECIMALS):
+    """
+    Values as float32, rounded first to the plotted decimals: rounding a
+    float32 of the full value can land on the other side of a half and
+    show a different value than the text file.
+    """
+    return np.round(values, decimals).astype(np.float32)
+
+
+def from_days(ordinals):
+    """Inverse of to_days, as datetime64[ns]."""
+    days = ordinals.astype(np.int64).astype('datetime64[D]')
+    days[ordinals == MISSING_DAY] = np.datetime64('NaT')
+    return days.astype('datetime64[ns]')
+
+
+class CompactPairs:
+    """
+    A (first_date, second_date, value) pair table stored as int32 day
+    ordinals and float32 values (rounded to COH_DECIMALS), or, for a
+    flag column whose values are
+    all 1 or missing, as bits packed 8 to a byte.
+
+    Parameters:
+    - first_days, second_days (np.ndarray): int32 day ordinals.
+    - values (np.ndarray): float32 values, or packed bits for flags.
+    - value_column (str): Name of the value column.
+    - flags (bool): Whether values are packed flags.
+    """
+
+    def __init__(self, first_days, second_days, values, value_column,
+                 flags=False):
+        self.first_days = first_days
+        self.second_days = second_days
+        self.values = values
+        self.value_column = value_column
+        self.flags = flags
+
+    @classmethod
+    def from_frame(cls, frame, value_column, pack_flags=True):
+        """
+        Compact a frame with first_date, second_date and value_column
+        columns (and a default index); values are kept as float32 unless
+        pack_flags and they are all 1 or missing.
+        """
+        values = frame[value_column].to_numpy(dtype=np.float64)
+        present = ~np.isnan(values)
+        flags = pack_flags and bool(np.all(values[present] == 1))
+        if flags:
+            values = np.packbits(present)
+        else:
+            values = to_float32(values)
+        return cls(to_days(frame.first_date), to_days(frame.second_date),
+                   values, value_column, flags)
+
+    def __len__(self):
+        return len(self.first_days)
+
+    @property
+    def nbytes(self):
+        """Memory held by the arrays."""
+        return sum(array.nbytes for array in
+                   (self.first_days, self.second_days, self.values))
+
+    def to_frame(self):
+        """
+        Return the table as a new frame with datetime64 dates and a
+        float64 value column, as read from the data file.
+        """
+        if self.flags:
+            present = np.unpackbits(self.values, count=len(self)).astype(bool)
+            values = np.where(present, 1.0, np.nan)
+        else:
+            values = self.values.astype(np.float64)
+        return pd.DataFrame({
+            'first_date': from_days(self.first_days),
+            'second_date': from_days(self.second_days),
+            self.value_column: values,
+        })
@@ -20,6 +20,7 @@ from io import StringIO
 import numpy as np
 import pandas as pd
 import requests
+import yaml
 import dash
 from dash import html
 from dash_leaflet import Marker, Tooltip
@@ -35,12 +36,21 @@ from pages.components.observation_log_components import (
 from global_variables import (
     BASELINE_DTICK,
     BASELINE_MAX,
+    BASELINE_WEBGL_EDGES,
     CMAP_NAME,
+    COH_DECIMALS,
     COH_LIMS,
     DAYS_PER_YEAR,
+    HEATMAP_SPARSE_FILL,
     MAX_YEARS,
     YEAR_AXES_COUNT
 )
+from baseline_network import BaselineNetwork
+from coherence_store import coherence_stores, state_frame
+from compact_pairs import CompactPairs, to_float32
+from figure_cache import figure_cache, figure_key
+from loader_cache import cached_loader, file_stamp
+from tile_footprint import tile_footprints
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 from scripts.get_latest_baselines import get_latest_baselines
@@ -55,6 +65,7 @@ def get_latest_csv():
     get_latest_baselines()
     get_latest_coh_matrices()
     get_latest_insar_pairs()
+    convert_latest_csv()
 
 
 def get_config_params():
@@ -426,75 +437,138 @@ def populate_beam_selector(vrrc_api_ip):
             target_coordinates = matching_target['geometry']['coordinates'][0]
             centroid_x, centroid_y = calc_polygon_centroid(target_coordinates)
             beam_dict[site_beam_string] = [centroid_y, centroid_x]
+            tile_footprints.add(site_string, target_coordinates)
         except TypeError:
             beam_dict['API Response Error'] = [50.64, -123.60]
     return beam_dict
 
 
-def pivot_and_clean(coh_long):
-    """Convert long-form coherence to wide-form and clean it up."""
-    coh_wide = coh_long.pivot(
-        index='delta_days',
-        columns='second_date',
-        values='coherence')
-    # include zero baseline even though it will never be valid
-    coh_wide.loc[0, :] = np.NaN
-    coh_wide.sort_index(inplace=True)
-    # because hovertemplate 'f' format doesn't handle NaN properly
-    coh_wide = coh_wide.round(2)
-
-    cw_last_col = coh_wide.max(axis='columns').last_valid_index()
-    cw_first_ind = coh_wide.max(axis='index').first_valid_index()
-    cw_last_ind = coh_wide.max(axis='index').last_valid_index()
-    cw_col = coh_wide.columns
-    # trim empty edges
-    coh_wide = coh_wide.loc[
-        (coh_wide.index >= 0) & (coh_wide.index <= cw_last_col),
-        (cw_col >= cw_first_ind) & (cw_col <= cw_last_ind)
-    ]
-    return coh_wide
+def _date_labels(dates, date_format='%b %d, %Y', missing=pd.NaT):
+    """
+    Return integer codes of dates and their labels, formatting each
+    distinct date once; the code -1 (missing date) maps to the missing
+    value at the end of the labels.
+    """
+    codes, uniques = pd.factorize(dates)
+    labels = np.append(
+        pd.DatetimeIndex(uniques).strftime(date_format).to_numpy(
+            dtype=object),
+        missing)
+    return codes, labels
 
 
-def pivot_and_clean_insar(insar_long):
-    """Convert long-form coherence to wide-form and clean it up."""
-    insar_wide = insar_long.pivot(
-        index='delta_days',
-        columns='second_date',
-        values='insar_pair')
-    # include zero baseline even though it will never be valid
-    insar_wide.loc[0, :] = np.NaN
-    insar_wide.sort_index(inplace=True)
-    # because hovertemplate 'f' format doesn't handle NaN properly
-    insar_wide = insar_wide.round(2)
-    # trim empty edges
-    first_valid_row_index = insar_wide.dropna(how='all').index[0]
-    last_valid_row_index = insar_wide.dropna(how='all').index[-1]
-    first_valid_col_index = insar_wide.dropna(axis=1, how='all').columns[0]
-    last_valid_col_index = insar_wide.dropna(axis=1, how='all').columns[-1]
-    insar_wide = insar_wide.loc[first_valid_row_index:last_valid_row_index,
-                                first_valid_col_index:last_valid_col_index]
-    return insar_wide
-
-
-def pivot_and_clean_dates(coh_long, coh_wide):
-    """Convert long-form df to wide-form date matrix matching coh_wide."""
-    coh_long = coh_long.drop(
-        coh_long[coh_long.second_date < coh_long.first_date].index
-    )
-    date_wide = coh_long.pivot(
+def sparse_and_clean(long_df, values, zero_baseline=True):
+    """
+    Convert long-form data to the sparse cells of its matrix, trimmed
+    to the rows and columns with values and rounded to COH_DECIMALS.
+
+    Only the non-empty cells are kept, plus one empty cell for each row
+    (temporal baseline) and column (second date) of the dense matrix
+    without any value, so a heatmap of the cells has the same grid as
+    one of the dense matrix.
+
+    Parameters:
+    - long_df (pd.DataFrame): first_date, second_date, delta_days and
+        the values column.
+    - values (str): Column of the cell values.
+    - zero_baseline (bool): Keep a zero baseline row, as the coherence
+        plot does; the InSAR pair plot trims it.
+
+    Returns:
+    - pd.DataFrame: second_date, delta_days, value and start (the hover
+        label of first_date) of each cell.
+    """
+    long_df = long_df.loc[long_df.second_date >= long_df.first_date]
+    value = long_df[values].round(COH_DECIMALS)
+    valid = long_df.loc[value.notna()]
+    cells = pd.DataFrame({
+        'second_date': valid.second_date,
+        'delta_days': valid.delta_days,
+        'value': value[value.notna()],
+    })
+    codes, labels = _date_labels(valid.first_date)
+    cells['start'] = labels[codes]
+    if cells.empty:
+        return cells
+
+    # rows and columns of the trimmed dense matrix
+    first_row = 0 if zero_baseline else cells.delta_days.min()
+    last_row = cells.delta_days.max()
+    first_col = cells.second_date.min()
+    last_col = cells.second_date.max()
+    rows = long_df.delta_days.unique()
+    rows = rows[(rows >= first_row) & (rows <= last_row)]
+    if zero_baseline:
+        rows = np.append(rows, 0)
+    cols = long_df.second_date.unique()
+    cols = cols[(cols >= first_col) & (cols <= last_col)]
+    empty_rows = np.setdiff1d(rows, cells.delta_days.unique())
+    empty_cols = np.setdiff1d(cols, cells.second_date.unique())
+    empty = pd.DataFrame({
+        'second_date': np.concatenate((
+            np.full(len(empty_rows), first_col, dtype=cols.dtype),
+            empty_cols)),
+        'delta_days': np.concatenate((
+            empty_rows,
+            np.full(len(empty_cols), first_row, dtype=rows.dtype))),
+        'value': np.nan,
+        'start': None,
+    })
+    return pd.concat([cells, empty], ignore_index=True)
+
+
+def heatmap_cells(cells, sparse_fill=HEATMAP_SPARSE_FILL):
+    """
+    Heatmap x, y, z and text of the cells from sparse_and_clean.
+
+    A matrix filled less than sparse_fill is sent as its cells, 1-D
+    arrays that plotly.js bins into the grid; a fuller one is sent as
+    the dense matrix, which is then smaller. Dates are sent as days.
+
+    Returns:
+    - dict: x, y, z and text arguments of go.Heatmap.
+    """
+    codes, days = _date_labels(cells.second_date, '%Y-%m-%d')
+    grid_size = (len(days) - 1) * cells.delta_days.nunique()
+    if cells.value.count() < sparse_fill * grid_size:
+        return {
+            'x': days[codes],
+            'y': cells.delta_days.to_numpy(),
+            'z': cells.value.to_numpy(),
+            'text': cells.start.to_numpy(),
+        }
+    wide = cells.assign(second_date=days[codes]).pivot(
         index='delta_days',
-        columns='second_date',
-        values='first_date')
-    date_wide = date_wide.map(lambda x: pd.to_datetime(x)
-                              .strftime('%b %d, %Y') if x is not pd.NaT
-                              else x)
-    # remove some columns so that date_wide has
-    # the same columns as coh_wide
-    common_cols = list(set(date_wide.columns).intersection(coh_wide.columns))
-    common_cols.sort()
-    date_wide = date_wide[common_cols]
-    # date_wide.drop(columns=date_wide.columns[0], axis=1,  inplace=True)
-    return date_wide
+        columns='second_date')
+    return {
+        'x': wide['value'].columns.to_numpy(),
+        'y': wide.index.to_numpy(),
+        'z': wide['value'].to_numpy(),
+        'text': wide['start'].to_numpy(),
+    }
+
+
+def band_cells(cells, baseline_limits):
+    """
+    Return the cells from sparse_and_clean a year band displays: the
+    rows within baseline_limits and the nearest row beyond each limit,
+    so the bricks at the band edges keep their height, plus an empty
+    cell for each column left without one.
+    """
+    rows = np.sort(cells.delta_days.unique())
+    first = max(np.searchsorted(rows, baseline_limits[0], 'left') - 1, 0)
+    last = min(np.searchsorted(rows, baseline_limits[1], 'right'),
+               len(rows) - 1)
+    band = cells.loc[cells.delta_days.between(rows[first], rows[last])]
+    empty_cols = np.setdiff1d(cells.second_date.unique(),
+                              band.second_date.unique())
+    empty = pd.DataFrame({
+        'second_date': empty_cols,
+        'delta_days': rows[first],
+        'value': np.nan,
+        'start': None,
+    })
+    return pd.concat([band, empty], ignore_index=True)
 
 
 def plot_coherence(coh_long, insar_long):
@@ -507,36 +581,62 @@ def plot_coherence(coh_long, insar_long):
     if coh_long is None:
         return fig
 
-    coh_long['delta_days'] = (
+    coh_long = coh_long.assign(delta_days=(
         coh_long.second_date - coh_long.first_date
-    ).dt.days
-    coh_wide = pivot_and_clean(coh_long)
-    date_wide = pivot_and_clean_dates(coh_long, coh_wide)
+    ).dt.days)
+    coh_cells = sparse_and_clean(coh_long, 'coherence')
 
     if insar_long is not None:
-        insar_long['delta_days'] = (
+        insar_long = insar_long.assign(delta_days=(
             insar_long.second_date - insar_long.first_date
-        ).dt.days
-        insar_wide = pivot_and_clean_insar(insar_long)
-        insar_date_wide = pivot_and_clean_dates(insar_long, insar_wide)
+        ).dt.days)
+        insar_cells = sparse_and_clean(insar_long, 'insar_pair',
+                                       zero_baseline=False)
         insar_colorscale = [
             [0, 'rgba(0,0,0,0)'],
             [1, 'grey']
         ]
 
+    second_date_limits = [
+        max(
+            coh_cells.second_date.min(),
+            coh_cells.second_date.max() - pd.to_timedelta(
+                DAYS_PER_YEAR * MAX_YEARS, 'days'
+            )
+        ) - pd.to_timedelta(4, 'days'),
+        coh_cells.second_date.max() + pd.to_timedelta(4, 'days')
+    ]
     for year in range(YEAR_AXES_COUNT):
+        if year == 0:
+            baseline_limits = [0, BASELINE_MAX]
+        else:
+            baseline_limits = list(
+                int(
+                    year * DAYS_PER_YEAR
+                ) + BASELINE_MAX / 2 * np.array([-1, 1])
+            )
+        # with several year bands, each one only gets the baselines it
+        # displays rather than a copy of the whole matrix
+        coh_band = coh_cells
+        if YEAR_AXES_COUNT > 1:
+            coh_band = band_cells(coh_cells, baseline_limits)
+        coh_heatmap = heatmap_cells(coh_band)
         if insar_long is not None:
+            insar_band = insar_cells
+            if YEAR_AXES_COUNT > 1:
+                insar_band = band_cells(insar_cells, baseline_limits)
+            insar_heatmap = heatmap_cells(insar_band)
             # Grey heatmap for potential insar pair
             fig.add_trace(
                 go.Heatmap(
-                    z=insar_wide.values,
-                    x=insar_wide.columns,
-                    y=insar_wide.index,
+                    z=insar_heatmap['z'],
+                    x=insar_heatmap['x'],
+                    y=insar_heatmap['y'],
                     xgap=1,
                     ygap=1,
-                    customdata=insar_date_wide,
+                    text=insar_heatmap['text'],
                     hovertemplate=(
-                        'Start Date: %{customdata}<br>'
+                        'Start Date: %{text}<br>'
                         'End Date: %{x}<br>'
                         'Temporal Baseline: %{y} days<br>'
                         'Value: %{z}'),
@@ -547,36 +647,19 @@ def plot_coherence(coh_long, insar_long):
         # Colored heatmap for processed insar pairs
         fig.add_trace(
             go.Heatmap(
-                z=coh_wide.values,
-                x=coh_wide.columns,
-                y=coh_wide.index,
+                z=coh_heatmap['z'],
+                x=coh_heatmap['x'],
+                y=coh_heatmap['y'],
                 xgap=1,
                 ygap=1,
-                customdata=date_wide,
+                text=coh_heatmap['text'],
                 hovertemplate=(
-                    'Start Date: %{customdata}<br>'
+                    'Start Date: %{text}<br>'
                     'End Date: %{x}<br>'
                     'Temporal Baseline: %{y} days<br>'
                     'Coherence: %{z}'),
                 coloraxis='coloraxis'),
             row=year + 1, col=1)
-        if year == 0:
-            baseline_limits = [0, BASELINE_MAX]
-        else:
-            baseline_limits = list(
-                int(
-                    year * DAYS_PER_YEAR
-                ) + BASELINE_MAX / 2 * np.array([-1, 1])
-            )
-        second_date_limits = [
-            max(
-                coh_wide.columns.min(),
-                coh_wide.columns.max() - pd.to_timedelta(
-                    DAYS_PER_YEAR * MAX_YEARS, 'days'
-                )
-            ) - pd.to_timedelta(4, 'days'),
-            coh_wide.columns.max() + pd.to_timedelta(4, 'days')
-        ]
         fig.update_yaxes(
             range=baseline_limits,
             dtick=BASELINE_DTICK,
@@ -604,49 +687,62 @@ def plot_coherence(coh_long, insar_long):
     return fig
 
 
-def plot_baseline(df_baseline, df_cohfull):
-    """Plot perpendicular baseline as a function of time."""
-    if df_baseline is None or df_cohfull is None:
+def baseline_edges(network):
+    """
+    Line segments of the processed interferogram network in the
+    perpendicular baseline plot.
+
+    Each processed pair whose first date has a bperp is a segment from
+    (first_date, bperp of first_date) to (second_date, bperp of
+    second_date); segments are separated by a gap.
+
+    Parameters:
+    - network (BaselineNetwork): The baseline network of the target.
+
+    Returns:
+    - tuple: x (YYYY-MM-DD labels, None in the gaps) and y (bperp, NaN
+        in the gaps) arrays of the segments, 3 points per pair.
+    """
+    pairs = network.processed()
+    first_bperp = pairs['first_bperp'].to_numpy()
+    second_bperp = pairs['second_bperp'].to_numpy()
+    valid = ~np.isnan(first_bperp)
+    count = int(valid.sum())
+    # format each distinct date once; the gaps take the None at the end
+    codes, labels = _date_labels(
+        pd.concat([pairs['first_date'][valid], pairs['second_date'][valid]]),
+        '%Y-%m-%d', None)
+    edge_codes = np.full(3 * count, -1, dtype=np.intp)
+    edge_codes[0::3] = codes[:count]
+    edge_codes[1::3] = codes[count:]
+    edge_y = np.full(3 * count, np.nan)
+    edge_y[0::3] = first_bperp[valid]
+    edge_y[1::3] = second_bperp[valid]
+    return labels[edge_codes], edge_y
+
+
+def plot_baseline(network):
+    """
+    Plot perpendicular baseline as a function of time.
+
+    Parameters:
+    - network (BaselineNetwork or None): The baseline network of the
+        target, from load_network.
+    """
+    if network is None:
         bperp_combined_fig = go.Figure()
         return bperp_combined_fig
-    # if :
-    #     bperp_combined_fig = go.Figure()
-    #     return bperp_combined_fig
-    bperp_scatter_fig = go.Scatter(x=df_baseline['second_date'],
-                                   y=df_baseline['bperp'],
+    acquisitions = network.nodes.loc[network.nodes['bperp'].notna()]
+    bperp_scatter_fig = go.Scatter(x=acquisitions['date'],
+                                   y=acquisitions['bperp'],
                                    mode='markers')
-    df_baseline_edge = df_cohfull[df_cohfull['coherence'].notna()]
-    df_baseline_edge = df_baseline_edge.drop(columns=['coherence'])
-    df_baseline_edge = pd.merge(df_baseline_edge,
-                                df_baseline[['second_date', 'bperp']],
-                                right_on='second_date',
-                                left_on='first_date',
-                                how='left')
-    df_baseline_edge = df_baseline_edge.drop(columns=['second_date_y'])
-    df_baseline_edge = \
-        df_baseline_edge.rename(columns={"second_date_x": "second_date",
-                                         "bperp": "bperp_reference_date"})
-    df_baseline_edge = pd.merge(df_baseline_edge,
-                                df_baseline[['second_date', 'bperp']],
-                                right_on='second_date',
-                                left_on='second_date',
-                                how='left')
-
-    df_baseline_edge = df_baseline_edge.rename(
-        columns={"bperp": "bperp_pair_date"})
-    df_baseline_edge = df_baseline_edge[
-        df_baseline_edge['bperp_reference_date'].notna()]
-
-    edge_x = []
-    edge_y = []
-
-    for _, edge in df_baseline_edge.iterrows():
-        edge_x.append(edge['first_date'])
-        edge_x.append(edge['second_date'])
-        edge_y.append(edge['bperp_reference_date'])
-        edge_y.append(edge['bperp_pair_date'])
-
-    bperp_line_fig = go.Scatter(x=edge_x, y=edge_y,
+    edge_x, edge_y = baseline_edges(network)
+    # large networks are drawn with WebGL
+    if len(edge_y) // 3 > BASELINE_WEBGL_EDGES:
+        line_trace = go.Scattergl
+    else:
+        line_trace = go.Scatter
+    bperp_line_fig = line_trace(x=edge_x, y=edge_y,
                                 line={"width": 0.5, "color": '#888'},
                                 mode='lines')
 
@@ -841,9 +937,108 @@ def build_summary_table(targs_geojson):
     return targets_df[['Site', 'Latest SAR Image', 'Unrest']]
 
 
+def _columnar_path(path):
+    """Typed columnar (Feather) copy of a data file."""
+    return f'{path}.feather'
+
+
+def _read_columnar(path, value_column=None):
+    """
+    Read the columnar copy of a data file, or None when there is none or
+    it is older than the file itself (e.g. synced without converting).
+    A value column stored as float32 is widened again here; it was
+    rounded to COH_DECIMALS before it was narrowed, so the plots show the
+    same rounded values as when reading the text file.
+    """
+    columnar = _columnar_path(path)
+    try:
+        columnar_mtime = os.path.getmtime(columnar)
+    except OSError:
+        return None
+    if os.path.exists(path) and os.path.getmtime(path) > columnar_mtime:
+        return None
+    frame = pd.read_feather(columnar)
+    if value_column is not None:
+        frame[value_column] = frame[value_column].astype('float64')
+    return frame
+
+
+def _write_columnar(frame, path, value_column=None):
+    """
+    Write the columnar copy of a data file atomically, storing
+    value_column as float32 rounded to COH_DECIMALS.
+    """
+    columnar = _columnar_path(path)
+    tmp_path = f'{columnar}.tmp'
+    if value_column is not None:
+        frame = frame.assign(**{value_column: to_float32(
+            frame[value_column].to_numpy(dtype=np.float64))})
+    frame.reset_index(drop=True).to_feather(tmp_path)
+    os.replace(tmp_path, columnar)
+
+
 def _read_coherence(coherence_csv):
+    if coherence_csv is not None:
+        state = coherence_stores.current(_store_dir(coherence_csv),
+                                         coherence_csv)
+        if state is not None:
+            return state_frame(state)
+    compact = _load_coherence(coherence_csv)
+    if compact is None:
+        return None
+    return compact.to_frame()
+
+
+@cached_loader
+def _load_coherence(coherence_csv):
     if coherence_csv is None:
         return None
+    coh = _read_columnar(coherence_csv, 'coherence')
+    if coh is None:
+        coh = _parse_coherence(coherence_csv)
+    return CompactPairs.from_frame(coh, 'coherence')
+
+
+def _store_dir(coherence_csv):
+    return os.path.join(os.path.dirname(coherence_csv), 'coherence_store')
+
+
+def ingest_coherence(target_id):
+    """
+    Add the coherence pairs of a target that are new or changed since
+    the last sync to its coherence store, unless the store is already
+    up to date with the coherence file.
+
+    Returns:
+    - int: The number of pairs added or changed.
+    """
+    coherence_csv = _coherence_csv(target_id)
+    if coherence_csv is None or not os.path.exists(coherence_csv):
+        return 0
+    store_dir = _store_dir(coherence_csv)
+    if coherence_stores.version(store_dir, coherence_csv) is not None:
+        return 0
+    coh = _read_columnar(coherence_csv, 'coherence')
+    if coh is None:
+        coh = _parse_coherence(coherence_csv)
+    return coherence_stores.ingest(store_dir, coh, file_stamp(coherence_csv))
+
+
+def _coherence_key(coherence_csv):
+    """
+    What a figure built from a coherence file is keyed on: the version
+    of its store when that is up to date, otherwise the file itself.
+    """
+    version = None
+    if coherence_csv is not None:
+        version = coherence_stores.version(_store_dir(coherence_csv),
+                                           coherence_csv)
+    if version is None:
+        return (coherence_csv,), ()
+    return (), (('coherence', version),)
+
+
+def _parse_coherence(coherence_csv):
     coh = pd.read_csv(
         coherence_csv,
         parse_dates=['Reference Date', 'Pair Date'])
@@ -858,8 +1053,25 @@ def _read_coherence(coherence_csv):
 
 
 def _read_insar_pair(insar_pair_csv):
+    compact = _load_insar_pair(insar_pair_csv)
+    if compact is None:
+        return None
+    return compact.to_frame()
+
+
+@cached_loader
+def _load_insar_pair(insar_pair_csv):
     if insar_pair_csv is None:
         return None
+    insar = _read_columnar(insar_pair_csv, 'insar_pair')
+    if insar is None:
+        insar = _parse_insar_pair(insar_pair_csv)
+    if insar is None:
+        return None
+    return CompactPairs.from_frame(insar, 'insar_pair')
+
+
+def _parse_insar_pair(insar_pair_csv):
     # Check if the file exists
     if not os.path.exists(insar_pair_csv):
         # raise FileNotFoundError(f"The file {insar_pair_csv} does not exist.")
@@ -881,9 +1093,17 @@ def _read_insar_pair(insar_pair_csv):
     return insar
 
 
+@cached_loader
 def _read_baseline(baseline_csv):
     if baseline_csv is None:
         return None
+    baseline = _read_columnar(baseline_csv)
+    if baseline is None:
+        baseline = _parse_baseline(baseline_csv)
+    return baseline
+
+
+def _parse_baseline(baseline_csv):
     # Check if the file exists
     if not os.path.exists(baseline_csv):
         # raise FileNotFoundError(f"The file {insar_pair_csv} does not exist.")
@@ -913,6 +1133,133 @@ def _read_baseline(baseline_csv):
     return baseline
 
 
+def convert_to_columnar(target_id):
+    """
+    Write typed columnar copies (datetime64 dates, float32 coherence) of
+    the coherence, InSAR pair and baseline files of a target, so reads
+    skip text and date parsing. Files whose copy is up to date are
+    skipped.
+    """
+    for path, parse, value_column in (
+            (_coherence_csv(target_id), _parse_coherence, 'coherence'),
+            (_insar_pair_csv(target_id), _parse_insar_pair, 'insar_pair'),
+            (_baseline_csv(target_id), _parse_baseline, None)):
+        if path is None or not os.path.exists(path):
+            continue
+        if _is_current(_columnar_path(path), (path,)):
+            continue
+        frame = parse(path)
+        if frame is not None:
+            _write_columnar(frame, path, value_column)
+
+
+def _network_paths(target_id):
+    site, beam = target_id.rsplit('_', 1)
+    return (f'app/Data/{site}/{beam}/network_nodes.feather',
+            f'app/Data/{site}/{beam}/network_edges.feather')
+
+
+@cached_loader
+def _read_network_table(path):
+    return pd.read_feather(path)
+
+
+def _is_current(path, sources):
+    """True if path exists and no existing source file is newer."""
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return False
+    return all(os.path.getmtime(source) <= mtime
+               for source in sources if os.path.exists(source))
+
+
+def save_network(target_id):
+    """
+    Build the baseline network of a target from its baseline and
+    coherence files and write it next to them, nodes last so a reader
+    never sees new nodes with old edges.
+    """
+    network = BaselineNetwork.build(
+        _read_baseline(_baseline_csv(target_id)),
+        _read_coherence(_coherence_csv(target_id)))
+    for frame, path in zip((network.edges, network.nodes),
+                           reversed(_network_paths(target_id))):
+        tmp_path = f'{path}.tmp'
+        frame.to_feather(tmp_path)
+        os.replace(tmp_path, path)
+    logger.info('%s network: %s', target_id, network.stats())
+
+
+def load_network(target_id):
+    """
+    Return the baseline network of a target: the one written by the
+    sync step when it is up to date with the baseline and coherence
+    files, otherwise one built from them. None if either is missing.
+    """
+    if target_id == 'API Response Error':
+        return None
+    sources = (_baseline_csv(target_id), _coherence_csv(target_id))
+    nodes_path, edges_path = _network_paths(target_id)
+    if _is_current(nodes_path, sources) and _is_current(edges_path, sources):
+        return BaselineNetwork(_read_network_table(nodes_path),
+                               _read_network_table(edges_path))
+    baseline = _read_baseline(sources[0])
+    coherence = _read_coherence(sources[1])
+    if baseline is None or coherence is None:
+        return None
+    return BaselineNetwork.build(baseline, coherence)
+
+
+def convert_latest_csv():
+    """
+    Convert the data files of every site/beam in beamList.yml, ingest
+    their new coherence pairs and build their baseline networks, skipping
+    the targets whose files did not change.
+    """
+    for site, beam in _beam_list():
+        target_id = f'{site}_{beam}'
+        try:
+            convert_to_columnar(target_id)
+            ingest_coherence(target_id)
+        except (OSError, ValueError, RuntimeError) as exception:
+            logger.warning('Columnar conversion of %s/%s failed: %s',
+                           site, beam, exception)
+            continue
+        sources = (_baseline_csv(target_id), _coherence_csv(target_id))
+        if not os.path.exists(sources[0]):
+            continue
+        if all(_is_current(path, sources)
+               for path in _network_paths(target_id)):
+            continue
+        try:
+            save_network(target_id)
+        except (OSError, ValueError, KeyError) as exception:
+            logger.warning('Network of %s/%s failed: %s',
+                           site, beam, exception)
+
+
+def _beam_list():
+    """(site, beam) of every entry in beamList.yml."""
+    with open('app/Data/beamList.yml', encoding="utf-8") as beam_list_yml:
+        beam_list = yaml.safe_load(beam_list_yml)
+    return [(site, beam) for site in beam_list for beam in beam_list[site]]
+
+
+def available_targets():
+    """
+    Target IDs of the beamList.yml entries whose coherence file has been
+    synced, or an empty list when there is no beam list.
+    """
+    try:
+        beam_list = _beam_list()
+    except OSError:
+        return []
+    targets = [f'{site}_{beam}' for site, beam in beam_list]
+    return [target_id for target_id in targets
+            if os.path.exists(_coherence_csv(target_id))]
+
+
 def _valid_dates(coh):
     return coh.first_date.dropna().unique()
 
@@ -938,4 +1285,46 @@ def _baseline_csv(target_id):
     return f'app/Data/{site}/{beam}/bperp_all'
 
 
+def coherence_figure(target_id):
+    """
+    Coherence matrix plot of a target, rebuilt only when its coherence
+    store gains pairs, its InSAR pair file changes or the plotting
+    constants do.
+
+    Parameters:
+    - target_id (str): Target ID, '{site}_{beam}'.
+
+    Returns:
+    - dict: The figure, as parsed from its cached JSON.
+    """
+    coherence_csv = _coherence_csv(target_id)
+    insar_pair_csv = _insar_pair_csv(target_id)
+    paths, versions = _coherence_key(coherence_csv)
+    key = figure_key('coherence', target_id, paths + (insar_pair_csv,),
+                     versions)
+    return figure_cache.figure(key, lambda: plot_coherence(
+        _read_coherence(coherence_csv), _read_insar_pair(insar_pair_csv)))
+
+
+def baseline_figure(target_id):
+    """
+    Baseline plot of a target, rebuilt only when its baseline file
+    changes, its coherence store gains pairs or the plotting constants
+    change.
+
+    Parameters:
+    - target_id (str): Target ID, '{site}_{beam}'.
+
+    Returns:
+    - dict: The figure, as parsed from its cached JSON.
+    """
+    baseline_csv = _baseline_csv(target_id)
+    coherence_csv = _coherence_csv(target_id)
+    paths, versions = _coherence_key(coherence_csv)
+    key = figure_key('baseline', target_id, (baseline_csv,) + paths,
+                     versions)
+    return figure_cache.figure(key, lambda: plot_baseline(
+        load_network(target_id)))
+
+
 config = get_config_params()
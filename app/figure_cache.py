@@ -0,0 +1,106 @@
+#!/usr/bin/python3
+"""
+Volcano InSAR Interpretation Workbench
+
+Cache of serialized plot figures, shared by the workers through disk
+
+SPDX-License-Identifier: MIT
+
+Copyright (C) 2021-2024 Government of Canada
+
+Authors:
+  - Drew Rotheram <drew.rotheram-clarke@nrcan-rncan.gc.ca>
+"""
+import json
+import logging
+
+import plotly
+
+import global_variables
+from global_variables import (
+    FIGURE_CACHE_DIR,
+    FIGURE_CACHE_DISK_MB,
+    FIGURE_CACHE_MEMORY_ITEMS,
+    FIGURE_CACHE_MEMORY_MB,
+    TILE_CACHE_PRUNE_FRACTION
+)
+from loader_cache import file_stamp
+from tile_cache import MB, DiskLRU, MemoryLRU, TileCache
+
+logger = logging.getLogger(__name__)
+
+# plotting configuration a cached figure depends on
+PLOT_CONSTANTS = (
+    'BASELINE_DTICK',
+    'BASELINE_MAX',
+    'BASELINE_WEBGL_EDGES',
+    'CMAP_NAME',
+    'COH_DECIMALS',
+    'COH_LIMS',
+    'DAYS_PER_YEAR',
+    'HEATMAP_SPARSE_FILL',
+    'MAX_YEARS',
+    'TEMPORAL_HEIGHT',
+    'YEAR_AXES_COUNT',
+    'YEARS_MAX',
+)
+# bump when the plotting code changes the figures it builds
+FIGURE_VERSION = 7
+
+
+def figure_key(kind, target_id, paths, versions=()):
+    """
+    Cache key of a figure: its kind and target, the stamps of the files
+    it is built from (and of their columnar copies), the versions of the
+    stores it is built from, the plotting constants and the plotly
+    version.
+    """
+    stamps = tuple((file_stamp(path), file_stamp(f'{path}.feather'))
+                   for path in paths if path is not None)
+    constants = tuple(repr(getattr(global_variables, name))
+                      for name in PLOT_CONSTANTS)
+    return (FIGURE_VERSION, kind, target_id, stamps, tuple(versions),
+            constants, plotly.__version__)
+
+
+class FigureCache:
+    """
+    Serialized (JSON) figures in a memory tier in front of a disk tier
+    that every worker on the host shares.
+
+    Parameters:
+    - cache (TileCache): The two tiers; values are the JSON bytes.
+    """
+
+    def __init__(self, cache):
+        self.cache = cache
+        self.hits = 0
+        self.misses = 0
+
+    def figure(self, key, build):
+        """
+        Return the figure for key as a dict parsed from its JSON, which
+        is cached, or built with build() and cached first.
+        """
+        content = self.cache.get(key)
+        if content is not None:
+            self.hits += 1
+            return json.loads(content)
+        self.misses += 1
+        content = build().to_json().encode('utf-8')
+        self.cache.put(key, content)
+        logger.debug('Cached figure %s', key[1:3])
+        return json.loads(content)
+
+    def stats(self):
+        """Return counters of both tiers."""
+        return {'hits': self.hits, 'misses': self.misses,
+                **self.cache.stats()}
+
+
+figure_cache = FigureCache(TileCache(
+    MemoryLRU(FIGURE_CACHE_MEMORY_MB * MB, FIGURE_CACHE_MEMORY_ITEMS,
+              sizeof=len),
+    DiskLRU(FIGURE_CACHE_DIR, FIGURE_CACHE_DISK_MB * MB,
+            TILE_CACHE_PRUNE_FRACTION, encode=bytes, decode=bytes)
+))
@@ -9,7 +9,13 @@ Copyright (C) 2021-2023 Government of Canada
 Authors:
   - Chloe Lam <chloe.lam@nrcan-rncan.gc.ca>
 """
+import os
+
 import boto3
+from dotenv import load_dotenv
+
+load_dotenv()
+
 # verify = False for when working in office to bypass SSL Certificate Error
 s3 = boto3.client('s3', verify=False)
 
@@ -26,12 +32,94 @@ BASEMAP_NAME = 'USGS Topo'
 YEAR_AXES_COUNT = 1
 BASELINE_MAX = 150
 BASELINE_DTICK = 24
+# interferogram networks with more pairs are drawn with WebGL
+BASELINE_WEBGL_EDGES = 5000
 YEARS_MAX = 5
 CMAP_NAME = 'RdBu_r'
 COH_LIMS = (0.2, 0.4)
 TEMPORAL_HEIGHT = 300
 MAX_YEARS = 3
 DAYS_PER_YEAR = 365.25
+# decimals of the plotted coherence; values are rounded to them before
+# they are stored as float32, so the plots show the same values
+COH_DECIMALS = 2
+# coherence heatmaps filled less than this are sent as their cells only
+HEATMAP_SPARSE_FILL = 0.3
+# parsed coherence, InSAR pair and baseline files kept in memory
+LOADER_CACHE_ITEMS = 64
+# delta segments of a coherence store before they are compacted into one
+COHERENCE_STORE_MAX_SEGMENTS = 32
+# serialized coherence and baseline figures; a size of 0 disables a tier
+FIGURE_CACHE_MEMORY_MB = 64
+FIGURE_CACHE_MEMORY_ITEMS = 64
+FIGURE_CACHE_DISK_MB = int(os.getenv('FIGURE_CACHE_DISK_MB') or 256)
+FIGURE_CACHE_DIR = os.getenv('FIGURE_CACHE_DIR') or '/tmp/vrrc-figure-cache'
+# data shared by the callbacks of one target selection (seconds)
+TARGET_CONTEXT_WORKERS = 4
+TARGET_CONTEXT_TTL = 5
+TARGET_CONTEXT_ITEMS = 32
+TARGET_SWITCH_HISTORY = 50
+# targets warmed concurrently into the caches at start; 0 disables
+WARMUP_WORKERS = int(os.getenv('WARMUP_WORKERS') or 2)
+
+# tile proxy configuration (per worker, overridable from the environment)
+TILE_POOL_SIZE = int(os.getenv('TILE_POOL_SIZE') or 16)
+TILE_POOL_BLOCK = True
+TILE_MAX_IN_FLIGHT = int(os.getenv('TILE_MAX_IN_FLIGHT') or 32)
+TILE_TIMEOUT = 10
+# tile cache; a size of 0 disables that tier
+TILE_CACHE_MEMORY_MB = int(os.getenv('TILE_CACHE_MEMORY_MB') or 64)
+TILE_CACHE_MEMORY_ITEMS = 20000
+TILE_CACHE_DISK_MB = int(os.getenv('TILE_CACHE_DISK_MB') or 1024)
+TILE_CACHE_DIR = os.getenv('TILE_CACHE_DIR') or '/tmp/vrrc-tile-cache'
+TILE_CACHE_PRUNE_FRACTION = 0.9
+# tiles missing from S3 are answered with a transparent tile ('empty')
+# or a 404 ('404'), and remembered for TILE_NEGATIVE_TTL seconds
+TILE_MISSING = os.getenv('TILE_MISSING') or 'empty'
+TILE_NEGATIVE_TTL = 600
+TILE_NEGATIVE_ITEMS = 100000
+# browser cache lifetime of pair tiles, which never change once generated
+TILE_MAX_AGE = 365 * 24 * 60 * 60
+# 'proxy' streams tiles through the workers, 'redirect' answers with a
+# 302 to a presigned S3 url
+TILE_MODE = os.getenv('TILE_MODE') or 'proxy'
+TILE_URL_EXPIRY = 3600
+TILE_URL_REFRESH_MARGIN = 300
+TILE_URL_CACHE_ITEMS = 50000
+# 'auto' sends tiles as WebP to clients that accept it and as palette
+# PNG to others, for slow links; 'none' sends them as stored
+TILE_TRANSCODE = os.getenv('TILE_TRANSCODE') or 'none'
+TILE_TRANSCODE_QUALITY = 80
+TILE_TRANSCODE_COLORS = 64
+# batch endpoint fetching a whole viewport of tiles at once
+TILE_BATCH_WORKERS = 16
+TILE_BATCH_MAX_TILES = 256
+# background tile prefetching when a pair is selected
+TILE_PREFETCH_WORKERS = 4
+TILE_PREFETCH_MAX_TILES = 256
+# seconds between listings of the tiles bucket for the pair inventory
+TILE_INVENTORY_REFRESH = 600
+# seconds a pair found missing by a direct check is not checked again
+TILE_INVENTORY_MISS_TTL = 60
+# tiles outside the target polygons (plus a margin in tiles) get the
+# missing tile without any lookup
+TILE_FOOTPRINT_MARGIN = 1
+TILE_FOOTPRINT_MAX_ZOOM = 22
+# local MBTiles archives ({site}/{beam}/{pair}.mbtiles) served instead of
+# S3 for the pairs they hold
+TILE_ARCHIVE_DIR = os.getenv('TILE_ARCHIVE_DIR') or 'app/Data/tiles'
+# on-demand rendering of pairs without a tile pyramid from the processed
+# interferograms, under a local directory or an s3:// url
+TILE_RENDER_ROOT = os.getenv('TILE_RENDER_ROOT') or 'app/Data/interferograms'
+TILE_RENDER_PATH = '{site}/{beam}/{first}_HH_{second}_HH.adf.wrp.geo.tif'
+# plotly cyclical colour scale for the wrapped phase
+TILE_RENDER_CMAP = 'HSV'
+# tiles per side of the window read from the raster at once
+TILE_RENDER_METATILE = 4
+TILE_RENDER_CACHE_MB = int(os.getenv('TILE_RENDER_CACHE_MB') or 256)
+TILE_RENDER_CACHE_ITEMS = 512
+# rasters each rendering thread keeps open
+TILE_RENDER_DATASETS = 8
 
 # styling for legend text
 LEGEND_TEXT_STYLING = {
@@ -0,0 +1,120 @@
+#!/usr/bin/python3
+"""
+Volcano InSAR Interpretation Workbench
+
+Process-wide cache of parsed data files, invalidated when a file changes
+
+SPDX-License-Identifier: MIT
+
+Copyright (C) 2021-2024 Government of Canada
+
+Authors:
+  - Drew Rotheram <drew.rotheram-clarke@nrcan-rncan.gc.ca>
+"""
+import functools
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+from global_variables import LOADER_CACHE_ITEMS
+
+logger = logging.getLogger(__name__)
+
+
+def file_stamp(path):
+    """
+    Return (inode, mtime in ns, size) of a file, or None if it cannot
+    be read. The S3 sync scripts download to a temporary file and rename
+    it into place, so a replaced file always gets a new stamp.
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+def value_size(value):
+    """Approximate memory held by a cached value, in bytes."""
+    if hasattr(value, 'memory_usage'):
+        return int(value.memory_usage(deep=True).sum())
+    return getattr(value, 'nbytes', 0)
+
+
+class LoaderCache:
+    """
+    LRU of values parsed from files, keyed on loader, path and file
+    stamp.
+
+    Parameters:
+    - max_items (int): Number of cached values.
+    """
+
+    def __init__(self, max_items=LOADER_CACHE_ITEMS):
+        self.max_items = max_items
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def load(self, loader, path):
+        """
+        Return loader(path), parsing the file again only if it changed
+        since the cached value was loaded.
+        """
+        stamp = file_stamp(path)
+        if stamp is None:
+            # let the loader report the missing file
+            return loader(path)
+        key = (loader.__qualname__, path)
+        with self._lock:
+            cached = self._items.get(key)
+            if cached is not None and cached[0] == stamp:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return cached[1]
+            self.misses += 1
+        value = loader(path)
+        with self._lock:
+            self._items[key] = (stamp, value)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+        logger.debug('Loaded %s with %s', path, loader.__qualname__)
+        return value
+
+    def clear(self):
+        """Drop every cached value."""
+        with self._lock:
+            self._items.clear()
+
+    def stats(self):
+        """Return counters and current size."""
+        with self._lock:
+            values = [value for _, value in self._items.values()]
+            return {
+                'items': len(self._items),
+                'bytes': sum(value_size(value) for value in values),
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+
+loader_cache = LoaderCache()
+
+
+def cached_loader(function):
+    """
+    Decorate a loader taking a file path so repeat calls for an
+    unchanged file return the previously parsed value.
+
+    The cached value is shared by every caller, so callers must not
+    modify it in place.
+    """
+    @functools.wraps(function)
+    def wrapper(path):
+        if path is None:
+            return function(path)
+        return loader_cache.load(function, path)
+    return wrapper
@@ -12,12 +12,11 @@ Authors:
   - Mandip Singh Sond <mandip.sond@nrcan-rncan.gc.ca>
 """
 import logging
-import requests
 import dash
 import pandas as pd
 
-from dash import html, callback
-from dash.dcc import Graph, Tab, Tabs
+from dash import html, callback, clientside_callback
+from dash.dcc import Graph, Store, Tab, Tabs
 from dash_bootstrap_templates import load_figure_template
 import dash_bootstrap_components as dbc
 from dash_leaflet import (
@@ -31,21 +30,19 @@ from dash_extensions.enrich import (
     Output,
     DashProxy,
     Input,
-    MultiplexerTransform
+    MultiplexerTransform,
+    State
 )
 from pages.components.gc_header import gc_header, gc_line
 from global_components import generate_controls
 from data_utils import (
-    _baseline_csv,
     _coherence_csv,
     _insar_pair_csv,
-    _read_baseline,
-    _read_coherence,
-    _read_insar_pair,
+    available_targets,
+    baseline_figure,
+    coherence_figure,
     parse_dates,
     plot_annotation_tab,
-    plot_baseline,
-    plot_coherence,
     populate_beam_selector,
     config,
     get_latest_quakes_chis_fsdn_site
@@ -53,6 +50,12 @@ from data_utils import (
 from global_variables import (
     TEMPORAL_HEIGHT
 )
+from tile_archive import tile_archive
+from tile_inventory import tile_inventory
+from tile_prefetch import prefetch_selection, tile_prefetcher
+from tile_render import tile_renderer
+from target_context import target_contexts
+from warmup import data_warmup
 
 logger = logging.getLogger(__name__)
 
@@ -60,13 +63,23 @@ dash.register_page(__name__, path='/site')
 
 # VARIABLES
 TILES_BUCKET = config['AWS_TILES_URL']
-HOST = config['WORKBENCH_HOST']
-PORT = config['WORKBENCH_PORT']
 TARGET_CENTRES_INI = populate_beam_selector(config['API_VRRC_IP'])
 TARGET_CENTRES = {i: TARGET_CENTRES_INI[i] for i in sorted(TARGET_CENTRES_INI)}
 INITIAL_TARGET = 'Meager_5M3'
 SITE_INI, BEAM_INI = INITIAL_TARGET.rsplit('_', 1)
 
+tile_inventory.start(TILES_BUCKET)
+
+# datasets loaded once per target selection for every callback it fires
+target_contexts.register('coherence', coherence_figure, eager=True)
+target_contexts.register('baseline', baseline_figure)
+target_contexts.register(
+    'earthquakes',
+    lambda target_id: get_latest_quakes_chis_fsdn_site(
+        target_id, TARGET_CENTRES),
+    eager=True
+)
+
 epicenters_df = get_latest_quakes_chis_fsdn_site(
     INITIAL_TARGET, TARGET_CENTRES
 )
@@ -168,15 +181,19 @@ temporal_view = html.Div(
     children=[
         Graph(
             id='coherence-matrix',
-            figure=plot_coherence(
-                _read_coherence(_coherence_csv(INITIAL_TARGET)),
-                _read_insar_pair(_insar_pair_csv(INITIAL_TARGET))
-            ),
+            figure=coherence_figure(INITIAL_TARGET),
             style={'height': TEMPORAL_HEIGHT},
         )
     ]
 )
 
+# parse and plot every synced target in the background, so the first
+# selection of a target is served from the loader and figure caches
+data_warmup.start(available_targets(), {
+    'coherence': coherence_figure,
+    'baseline': baseline_figure,
+})
+
 tab_style = {
     'borderBottom': '1px solid #d6d6d6',
     'color': 'black',
@@ -247,6 +264,10 @@ layout = html.Div(
     children=[
         # HEADER
         html.Div(id='gc-header-container'),
+        # target of the client-side tile batch warm-up
+        Store(id='tile-batch-warm'),
+        # id of the browser session, scoping its tile prefetches
+        Store(id='session-id', storage_type='session'),
         html.Div(
             children=gc_line(
                 border_width=3,
@@ -323,11 +344,13 @@ layout = html.Div(
     Output('curr-info-text', 'children', allow_duplicate=True),
     Input(component_id='coherence-matrix', component_property='clickData'),
     Input('site-dropdown', 'value'),
-    Input('tiles', 'zoom'),
-    Input('tiles', 'bounds'),
+    State('interferogram-bg', 'zoom'),
+    State('interferogram-bg', 'bounds'),
+    State('session-id', 'data'),
     prevent_initial_call=True
 )
-def update_interferogram(click_data, target_id, zoom, bounds):
+@target_contexts.timed(target_arg=1)
+def update_interferogram(click_data, target_id, zoom, bounds, session_id):
     """
     Update interferogram display and information text
     based on click data and site selection.
@@ -336,6 +359,11 @@ def update_interferogram(click_data, target_id, zoom, bounds):
     - click_data (dict or None): Click data from the
         'coherence-matrix' component.
     - target_id (str or None): Selected site and beam ID from 'site-dropdown'.
+    - zoom (int or None): Current zoom of the map.
+    - bounds (list or None): Current [[south, west], [north, east]]
+        bounds of the map, used to prefetch tiles for the selected pair.
+    - session_id (str or None): Browser session, whose prefetch of the
+        previous selection is replaced.
 
     Returns:
     - tuple: A tuple containing:
@@ -345,6 +373,8 @@ def update_interferogram(click_data, target_id, zoom, bounds):
     """
     if not target_id:
         raise PreventUpdate
+    if dash.ctx.triggered_id == 'site-dropdown':
+        tile_prefetcher.cancel(session_id)
     site, beam = target_id.rsplit('_', 1)
     if not click_data:
         url = "".join((f"/getTileUrl?bucket={TILES_BUCKET}&",
@@ -366,23 +396,30 @@ def update_interferogram(click_data, target_id, zoom, bounds):
                    f"startdate={first_str}&",
                    f"enddate={second_str}&",
                    "x={x}&y={y}&z={z}"))
-    test_url = "".join((f"http://{HOST}:{PORT}",
-                        f"/getTileUrl?bucket={TILES_BUCKET}&",
-                        f"site={site}&",
-                        f"beam={beam}&",
-                        f"startdate={first_str}&",
-                        f"enddate={second_str}&",
-                        "x=0&y=0&z=0"))
-    response = requests.get(test_url, timeout=10, verify=False)
-    if response.status_code == 200:
+    pair = f'{first_str}_{second_str}'
+    has_tiles = tile_archive.has_pair(site, beam, pair)
+    if has_tiles or tile_inventory.has_pair(site, beam, pair):
         logger.info('Interferogram: %s_HH_%s_HH.adf.wrp.geo.tif',
                     first_str,
                     second_str)
         print('SUCCESS UPDATE INTERFEROGRAM')
+        prefetch_selection(
+            session_id, TILES_BUCKET, site, beam, pair, zoom,
+            (*bounds[0], *bounds[1]) if bounds else None
+        )
         return (
             url,
             parse_dates(f'{first_str}_HH_{second_str}_HH.adf.wrp.geo.tif')
         )
+    if tile_renderer.has_pair(site, beam, pair):
+        # processed but not tiled yet: render tiles from the interferogram
+        logger.info('Rendering: %s_HH_%s_HH.adf.wrp.geo.tif',
+                    first_str,
+                    second_str)
+        return (
+            url.replace('/getTileUrl', '/getRenderedTile', 1),
+            parse_dates(f'{first_str}_HH_{second_str}_HH.adf.wrp.geo.tif')
+        )
     # else:
     logger.info('Failed to load: %s_HH_%s_HH.adf.wrp.geo.tif',
                 first_str,
@@ -390,6 +427,51 @@ def update_interferogram(click_data, target_id, zoom, bounds):
     raise PreventUpdate
 
 
+# Give each browser session an id, kept across reloads of the tab.
+clientside_callback(
+    """
+    function(modified, session_id) {
+        if (session_id) {
+            return window.dash_clientside.no_update;
+        }
+        return Date.now().toString(36) +
+            Math.random().toString(36).slice(2);
+    }
+    """,
+    Output('session-id', 'data'),
+    Input('session-id', 'modified_timestamp'),
+    State('session-id', 'data'),
+    prevent_initial_call=False
+)
+
+
+# Ask the server to fetch the whole viewport of the interferogram layer in
+# one concurrent batch whenever the map moves or another pair is shown, so
+# the per-tile requests Leaflet makes (a few at a time per browser
+# connection limit) are served from the tile cache, or in redirect mode
+# reuse urls presigned together.
+clientside_callback(
+    """
+    function(bounds, url, zoom) {
+        if (!bounds || zoom === undefined || !url ||
+                !url.startsWith('/getTileUrl')) {
+            return window.dash_clientside.no_update;
+        }
+        const query = url.split('?')[1].replace('&x={x}&y={y}&z={z}', '');
+        fetch(`/getTileBatch?${query}&z=${zoom}` +
+              `&south=${bounds[0][0]}&west=${bounds[0][1]}` +
+              `&north=${bounds[1][0]}&east=${bounds[1][1]}`);
+        return window.dash_clientside.no_update;
+    }
+    """,
+    Output('tile-batch-warm', 'data'),
+    Input('interferogram-bg', 'bounds'),
+    Input('tiles', 'url'),
+    State('interferogram-bg', 'zoom'),
+    prevent_initial_call=True
+)
+
+
 @callback(
     Output(component_id='coherence-matrix',
            component_property='figure',
@@ -397,6 +479,7 @@ def update_interferogram(click_data, target_id, zoom, bounds):
     Input(component_id='site-dropdown', component_property='value'),
     prevent_initial_call=True
 )
+@target_contexts.timed()
 def update_coherence(target_id):
     """
     Display a new coherence matrix based on the selected site.
@@ -414,10 +497,7 @@ def update_coherence(target_id):
                 coherence_csv)
     logger.info('Loading: %s',
                 insar_pair_csv)
-    coherence = _read_coherence(coherence_csv)
-    insar_pair = _read_insar_pair(insar_pair_csv)
-    print(coherence, insar_pair)
-    return plot_coherence(coherence, insar_pair)
+    return target_contexts.get(target_id, 'coherence')
 
 
 @callback(
@@ -430,6 +510,7 @@ def update_coherence(target_id):
      Input(component_id='site-dropdown', component_property='value')],
     prevent_initial_call=True
 )
+@target_contexts.timed(target_arg=1)
 def switch_temporal_view(tab, site):
     """
     Switch between temporal and spatial baseline plots
@@ -442,15 +523,14 @@ def switch_temporal_view(tab, site):
     Returns:
     - plotly.graph_objs.Figure: Updated coherence matrix or baseline plot.
     """
+    # a tab change reuses the selection's datasets but starts none
+    select = dash.ctx.triggered_id == 'site-dropdown'
     if tab == 'tab-1-coherence-graph':
         logger.info('coherence for %s',
                     site)
         return Graph(
             id='coherence-matrix',
-            figure=plot_coherence(
-                _read_coherence(_coherence_csv(site)),
-                _read_insar_pair(_insar_pair_csv(site))
-            ),
+            figure=target_contexts.get(site, 'coherence', select),
             style={'height': TEMPORAL_HEIGHT},
         )
     if tab == 'tab-2-baseline-graph':
@@ -458,10 +538,7 @@ def switch_temporal_view(tab, site):
                     site)
         return Graph(
             id='coherence-matrix',
-            figure=plot_baseline(
-                _read_baseline(_baseline_csv(site)),
-                _read_coherence(_coherence_csv(site))
-            ),
+            figure=target_contexts.get(site, 'baseline', select),
             style={'height': TEMPORAL_HEIGHT},
         )
     if tab == 'tab-3-annotations':
@@ -495,6 +572,7 @@ def switch_temporal_view(tab, site):
     Input(component_id='site-dropdown', component_property='value'),
     # prevent_initial_call=True
 )
+@target_contexts.timed()
 def recenter_map(target_id):
     """
     Recenter the map on a new site and update information text.
@@ -522,6 +600,7 @@ def recenter_map(target_id):
     Input('site-dropdown', 'value'),
     prevent_initial_call=True
 )
+@target_contexts.timed()
 def update_earthquake_markers(target_id):
     """
     Update earthquake markers on the map based on the selected site.
@@ -535,9 +614,7 @@ def update_earthquake_markers(target_id):
     """
     if not target_id:
         raise PreventUpdate
-    new_epicenters_df = get_latest_quakes_chis_fsdn_site(
-        target_id, TARGET_CENTRES
-    )
+    new_epicenters_df = target_contexts.get(target_id, 'earthquakes')
     if '#EventID' in new_epicenters_df.columns:
         new_markers = [
             CircleMarker(
@@ -589,6 +666,7 @@ def update_earthquake_markers(target_id):
     Input(component_id='site-dropdown', component_property='value'),
     # prevent_initial_call=True
 )
+@target_contexts.timed()
 def update_gc_header_title(target_id):
     """Display new gc header title"""
 
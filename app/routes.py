@@ -10,27 +10,120 @@ Authors:
   - Drew Rotheram <drew.rotheram-clarke@nrcan-rncan.gc.ca>
 """
 import logging
-from flask import Response, request
-import requests
+import time
+import uuid
 
-from global_variables import s3
+from flask import Response, jsonify, redirect, request
+from rasterio.errors import RasterioError
+
+from global_variables import (
+    TILE_BATCH_MAX_TILES,
+    TILE_MAX_AGE,
+    TILE_MISSING,
+    TILE_MODE,
+    TILE_NEGATIVE_TTL,
+    TILE_TRANSCODE
+)
+from figure_cache import figure_cache
+from loader_cache import loader_cache
+from target_context import target_contexts
+from tile_archive import tile_archive
+from tile_cache import Tile, tile_cache, tile_key, tile_missing
+from tile_client import tile_client, tile_flights
+from tile_footprint import tile_footprints
+from tile_inventory import tile_inventory, tiles_in_bounds
+from tile_png import EMPTY_TILE_PNG
+from tile_prefetch import tile_prefetcher
+from tile_service import (
+    MISSING_STATUS,
+    cached_tile,
+    download_tile,
+    get_signed_url,
+    load_tiles,
+    s3_etag,
+    tile_object_key
+)
+from tile_render import tile_renderer
+from tile_signer import tile_signer
+from tile_transcode import (
+    negotiate,
+    tile_mimetype,
+    tile_transcoder,
+    variant_etag
+)
+from warmup import data_warmup
 
 logger = logging.getLogger(__name__)
 
 
+def tile_response(tile, output='png'):
+    """
+    Build a long-lived, conditional response for a pair tile.
+
+    Pair tiles never change once generated, so they are marked immutable
+    and carry the S3 object ETag; a matching If-None-Match gets a 304.
+    The tile is transcoded first when output is 'webp' or 'png8'.
+    """
+    tile = tile_transcoder.transcode(tile, output)
+    response = Response(tile.content, mimetype=tile_mimetype(tile.content))
+    response.cache_control.public = True
+    response.cache_control.max_age = TILE_MAX_AGE
+    response.cache_control.immutable = True
+    if TILE_TRANSCODE == 'auto':
+        response.vary.add('Accept')
+    if tile.etag:
+        response.set_etag(tile.etag)
+    return response.make_conditional(request)
+
+
+def missing_tile_response():
+    """
+    Answer for a tile that does not exist: the shared transparent tile,
+    or a 404 when TILE_MISSING is '404'. Either is cached only briefly,
+    since the tile may still be generated.
+    """
+    if TILE_MISSING == '404':
+        response = Response('Tile not found', status=404,
+                            mimetype='text/plain')
+    else:
+        response = Response(EMPTY_TILE_PNG, mimetype='image/png')
+    response.cache_control.public = True
+    response.cache_control.max_age = TILE_NEGATIVE_TTL
+    return response
+
+
+def multipart_tiles_response(z, tiles):
+    """Pack found tiles into a multipart/mixed response, one part each."""
+    boundary = uuid.uuid4().hex
+    parts = []
+    for (x, y), (status, tile) in sorted(tiles.items()):
+        if status != 200:
+            continue
+        headers = [
+            f'--{boundary}',
+            'Content-Type: image/png',
+            f'Content-Location: {z}/{x}/{y}',
+            f'Content-Length: {len(tile.content)}',
+        ]
+        if tile.etag:
+            headers.append(f'ETag: "{tile.etag}"')
+        parts.append('\r\n'.join(headers).encode('utf-8') + b'\r\n\r\n')
+        parts.append(tile.content + b'\r\n')
+    parts.append(f'--{boundary}--\r\n'.encode('utf-8'))
+    return Response(b''.join(parts),
+                    content_type=f'multipart/mixed; boundary={boundary}')
+
+
 def add_routes(server):
     """ add routes"""
-    def get_signed_url(bucket, key):
-        logger.debug("Bucket: %s",
-                     bucket)
-        url = s3.generate_presigned_url(
-            'get_object',
-            Params={'Bucket': bucket, 'Key': key},
-            ExpiresIn=60  # URL expires in 60 seconds
-        )
-        logger.debug("URL: %s",
-                     url)
-        return url
+    def redirect_to_s3(bucket, key):
+        url, expires_at = tile_signer.sign(bucket, [key])[key]
+        response = redirect(url, code=302)
+        # let the browser reuse the redirect while the url is valid
+        response.cache_control.private = True
+        response.cache_control.max_age = max(
+            int(expires_at - time.time() - tile_signer.refresh_margin), 0)
+        return response
 
     @server.route('/getTileUrl')
     def get_tile_url():
@@ -42,7 +135,152 @@ def add_routes(server):
         startdate = request.args.get('startdate')
         enddate = request.args.get('enddate')
         bucket = request.args.get('bucket')
-        key = f"{site}/{beam}/{startdate}_{enddate}/{z}/{x}/{y}.png"
-        signed_url = get_signed_url(bucket, key)
-        response = requests.get(signed_url, timeout=10, verify=False)
-        return Response(response.content, mimetype='image/png')
+        pair = f"{startdate}_{enddate}"
+        output = negotiate(request.accept_mimetypes)
+        if not tile_footprints.contains(site, z, x, y):
+            return missing_tile_response()
+        archived = tile_archive.load(site, beam, pair, z, x, y)
+        if archived is not None:
+            status, tile = archived
+            if status in MISSING_STATUS:
+                return missing_tile_response()
+            return tile_response(tile, output)
+        key = tile_object_key(site, beam, pair, z, x, y)
+        if TILE_MODE == 'redirect':
+            return redirect_to_s3(bucket, key)
+        cache_key = tile_key(bucket, site, beam, pair, z, x, y)
+        known = cached_tile(cache_key)
+        if known is not None:
+            status, tile = known
+            if status in MISSING_STATUS:
+                return missing_tile_response()
+            return tile_response(tile, output)
+        if request.if_none_match:
+            # revalidate against the object ETag without the body
+            response = tile_client.head(
+                get_signed_url(bucket, key, 'head_object'))
+            # a HEAD 403 has no error code to tell a missing key from a
+            # rejected url, so only a 404 is trusted here
+            if response.status_code == 404:
+                tile_missing.add(cache_key)
+                return missing_tile_response()
+            etag = s3_etag(response)
+            if response.status_code == 200 and etag:
+                etag = variant_etag(etag, output)
+                if request.if_none_match.contains(etag):
+                    return tile_response(Tile(b'', etag))
+        status, tile = download_tile(bucket, key, cache_key)
+        if status in MISSING_STATUS:
+            return missing_tile_response()
+        if status != 200:
+            logger.warning('S3 returned %s for %s', status, key)
+            return Response('Tile unavailable', status=502,
+                            mimetype='text/plain')
+        return tile_response(tile, output)
+
+    @server.route('/getRenderedTile')
+    def get_rendered_tile():
+        """Render a tile of a pair from its processed interferogram."""
+        x = int(request.args.get('x'))
+        y = int(request.args.get('y'))
+        z = int(request.args.get('z'))
+        site = request.args.get('site')
+        beam = request.args.get('beam')
+        pair = f"{request.args.get('startdate')}_{request.args.get('enddate')}"
+        output = negotiate(request.accept_mimetypes)
+        if not tile_footprints.contains(site, z, x, y):
+            return missing_tile_response()
+        try:
+            rendered = tile_renderer.load(site, beam, pair, z, x, y)
+        except RasterioError as exception:
+            logger.warning('Rendering %s/%s/%s failed: %s',
+                           site, beam, pair, exception)
+            return Response('Tile unavailable', status=502,
+                            mimetype='text/plain')
+        if rendered is None:
+            return Response('Interferogram not found', status=404,
+                            mimetype='text/plain')
+        status, tile = rendered
+        if status in MISSING_STATUS:
+            return missing_tile_response()
+        return tile_response(tile, output)
+
+    @server.route('/getTileBatch')
+    def get_tile_batch():
+        """
+        Fetch a whole range of tiles of one pair at one zoom concurrently.
+
+        The range is given either as xmin/xmax/ymin/ymax tile indices or
+        as south/west/north/east bounds in degrees. With format=warm (the
+        default) the tiles are only loaded into the caches and a JSON
+        summary is returned, or in redirect mode only presigned; with
+        format=multipart they are returned as a multipart/mixed response.
+        """
+        z = int(request.args.get('z'))
+        site = request.args.get('site')
+        beam = request.args.get('beam')
+        bucket = request.args.get('bucket')
+        pair = f"{request.args.get('startdate')}_{request.args.get('enddate')}"
+        output = request.args.get('format', 'warm')
+        if 'south' in request.args:
+            x_min, x_max, y_min, y_max = tiles_in_bounds(
+                [float(request.args.get(edge))
+                 for edge in ('south', 'west', 'north', 'east')], z)
+        else:
+            x_min, x_max, y_min, y_max = (
+                int(request.args.get(edge))
+                for edge in ('xmin', 'xmax', 'ymin', 'ymax'))
+        count = (x_max - x_min + 1) * (y_max - y_min + 1)
+        if count > TILE_BATCH_MAX_TILES:
+            return Response(f'At most {TILE_BATCH_MAX_TILES} tiles per batch',
+                            status=400, mimetype='text/plain')
+        columns_rows = [(x, y) for x in range(x_min, x_max + 1)
+                        for y in range(y_min, y_max + 1)]
+        archived = tile_archive.has_pair(site, beam, pair)
+        if output == 'warm' and archived:
+            # tiles are served by a local archive, nothing to warm
+            return Response(status=204)
+        if output == 'warm' and TILE_MODE == 'redirect':
+            # presign the viewport in one pass, so the redirects of its
+            # tiles reuse the urls
+            tile_signer.sign(bucket, [
+                tile_object_key(site, beam, pair, z, x, y)
+                for x, y in columns_rows
+                if tile_footprints.contains(site, z, x, y)])
+            return Response(status=204)
+        tiles = load_tiles(bucket, site, beam, pair, z, columns_rows)
+        if output == 'multipart':
+            return multipart_tiles_response(z, tiles)
+        statuses = [status for status, _ in tiles.values()]
+        return jsonify({
+            'tiles': len(statuses),
+            'found': statuses.count(200),
+            'missing': sum(status in MISSING_STATUS for status in statuses),
+            'failed': sum(status not in (200, *MISSING_STATUS)
+                          for status in statuses),
+        })
+
+    @server.route('/tileMetrics')
+    def get_tile_metrics():
+        return jsonify({
+            'pool': tile_client.stats(),
+            'flights': tile_flights.stats(),
+            'cache': tile_cache.stats(),
+            'missing': tile_missing.stats(),
+            'inventory': tile_inventory.stats(),
+            'prefetch': tile_prefetcher.stats(),
+            'signer': tile_signer.stats(),
+            'archive': tile_archive.stats(),
+            'render': tile_renderer.stats(),
+            'footprints': tile_footprints.stats(),
+            'transcode': tile_transcoder.stats(),
+        })
+
+    @server.route('/targetMetrics')
+    def get_target_metrics():
+        return jsonify({
+            'loaders': loader_cache.stats(),
+            'figures': figure_cache.stats(),
+            'warmup': data_warmup.stats(),
+            **target_contexts.stats(),
+        })
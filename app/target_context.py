@@ -0,0 +1,201 @@
+#!/usr/bin/python3
+"""
+Volcano InSAR Interpretation Workbench
+
+Per-target context shared by the callbacks fired for one target selection
+
+SPDX-License-Identifier: MIT
+
+Copyright (C) 2021-2024 Government of Canada
+
+Authors:
+  - Drew Rotheram <drew.rotheram-clarke@nrcan-rncan.gc.ca>
+"""
+import functools
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+from global_variables import (
+    TARGET_CONTEXT_ITEMS,
+    TARGET_CONTEXT_TTL,
+    TARGET_CONTEXT_WORKERS,
+    TARGET_SWITCH_HISTORY
+)
+
+logger = logging.getLogger(__name__)
+
+
+class TargetContext:
+    """
+    Data loaded for one target selection, and the timings of the
+    callbacks it served.
+
+    Parameters:
+    - target_id (str): Target ID, '{site}_{beam}'.
+    - created (float): time.monotonic() of the selection.
+    """
+
+    def __init__(self, target_id, created):
+        self.target_id = target_id
+        self.created = created
+        self.futures = {}
+        self.callbacks = []
+        self.lock = threading.Lock()
+
+    def summary(self):
+        """
+        Return the callbacks run for the selection, their summed time
+        and the server time from the first start to the last end, in ms.
+        """
+        with self.lock:
+            callbacks = list(self.callbacks)
+        if not callbacks:
+            return {'target': self.target_id, 'callbacks': []}
+        first = min(start for _, start, _ in callbacks)
+        span = max(end for _, _, end in callbacks) - first
+        return {
+            'target': self.target_id,
+            'callbacks': [(name, round((end - start) * 1000, 1))
+                          for name, start, end in callbacks],
+            'busy_ms': round(sum(end - start
+                                 for _, start, end in callbacks) * 1000, 1),
+            'server_ms': round(span * 1000, 1),
+        }
+
+
+class TargetContexts:
+    """
+    Load each dataset of a selected target once, concurrently, for all
+    the callbacks the selection fires.
+
+    A context lives for ttl seconds after the first callback of a
+    selection touches it; its eager loaders start right away on a
+    thread pool, the others on first use. Concurrent callbacks asking
+    for the same dataset wait on the same load.
+
+    Parameters:
+    - workers (int): Threads running the loaders.
+    - ttl (float): Seconds a context is reused for the same target.
+    - max_items (int): Contexts kept.
+    - history (int): Target selections kept for the timing report.
+    """
+
+    def __init__(self, workers=TARGET_CONTEXT_WORKERS, ttl=TARGET_CONTEXT_TTL,
+                 max_items=TARGET_CONTEXT_ITEMS,
+                 history=TARGET_SWITCH_HISTORY):
+        self.ttl = ttl
+        self.max_items = max_items
+        self._loaders = {}
+        self._executor = ThreadPoolExecutor(
+            workers, thread_name_prefix='target-context')
+        self._contexts = OrderedDict()
+        self._switches = deque(maxlen=history)
+        self._lock = threading.Lock()
+
+    def register(self, name, loader, eager=False):
+        """
+        Register loader(target_id) as dataset name; eager datasets are
+        loaded as soon as a target is selected.
+        """
+        self._loaders[name] = (loader, eager)
+
+    def _submit(self, context, name):
+        # called with context.lock held
+        future = context.futures.get(name)
+        if future is None:
+            loader = self._loaders[name][0]
+            future = self._executor.submit(loader, context.target_id)
+            context.futures[name] = future
+        return future
+
+    def context(self, target_id, create=True):
+        """
+        Return the live context of a target; if there is none, create
+        one and start its eager loaders, or return None if not create.
+        """
+        now = time.monotonic()
+        with self._lock:
+            context = self._contexts.get(target_id)
+            if context is not None and now - context.created < self.ttl:
+                return context
+            if not create:
+                return None
+            context = TargetContext(target_id, now)
+            self._contexts[target_id] = context
+            self._contexts.move_to_end(target_id)
+            while len(self._contexts) > self.max_items:
+                self._contexts.popitem(last=False)
+            self._switches.append(context)
+        with context.lock:
+            for name, (_, eager) in self._loaders.items():
+                if eager:
+                    self._submit(context, name)
+        return context
+
+    def get(self, target_id, name, select=True):
+        """
+        Return dataset name of a target, loading it if no callback of
+        the current selection did yet. A failed load is not kept.
+
+        Callbacks not fired by a target selection pass select=False:
+        they share the live context if there is one, but otherwise load
+        the dataset alone rather than starting a selection (and its eager
+        loaders).
+        """
+        context = self.context(target_id, create=select)
+        if context is None:
+            return self._loaders[name][0](target_id)
+        with context.lock:
+            future = self._submit(context, name)
+        try:
+            return future.result()
+        except Exception:
+            with context.lock:
+                if context.futures.get(name) is future:
+                    del context.futures[name]
+            raise
+
+    def timed(self, target_arg=0):
+        """
+        Decorate a callback to record its time under the live selection
+        of the target in its positional argument target_arg, if any.
+        """
+        def decorator(function):
+            @functools.wraps(function)
+            def wrapper(*args):
+                start = time.monotonic()
+                try:
+                    return function(*args)
+                finally:
+                    self._record(args[target_arg], function.__name__,
+                                 start, time.monotonic())
+            return wrapper
+        return decorator
+
+    def _record(self, target_id, name, start, end):
+        if not target_id:
+            return
+        context = self.context(target_id, create=False)
+        if context is None:
+            logger.info('%s: %s took %.0f ms', target_id, name,
+                        (end - start) * 1000)
+            return
+        with context.lock:
+            context.callbacks.append((name, start, end))
+        summary = context.summary()
+        logger.info('%s: %s took %.0f ms, %.0f ms server time over %d '
+                    'callbacks for this selection', target_id, name,
+                    (end - start) * 1000, summary['server_ms'],
+                    len(summary['callbacks']))
+
+    def stats(self):
+        """Return the timings of the recent target selections."""
+        with self._lock:
+            switches = list(self._switches)
+        return {'switches': [context.summary() for context in switches]}
+
+
+target_contexts = TargetContexts()
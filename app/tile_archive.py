@@ -0,0 +1,187 @@
+#!/usr/bin/python3
+"""
+Volcano InSAR Interpretation Workbench
+
+Local single-file (MBTiles) archives of interferogram tile pyramids
+
+SPDX-License-Identifier: MIT
+
+Copyright (C) 2021-2024 Government of Canada
+
+Authors:
+  - Drew Rotheram <drew.rotheram-clarke@nrcan-rncan.gc.ca>
+"""
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+
+from global_variables import TILE_ARCHIVE_DIR
+from loader_cache import file_stamp
+from tile_cache import Tile
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_SUFFIX = '.mbtiles'
+# site, beam and pair end up in a local path
+NAME_PATTERN = re.compile(r'^[\w-]+$')
+
+SCHEMA = (
+    'CREATE TABLE metadata (name TEXT, value TEXT)',
+    'CREATE TABLE tiles (zoom_level INTEGER, tile_column INTEGER, '
+    'tile_row INTEGER, tile_data BLOB)',
+    'CREATE UNIQUE INDEX tile_index ON tiles '
+    '(zoom_level, tile_column, tile_row)',
+)
+
+
+def tile_etag(content):
+    """
+    ETag of tile bytes; the MD5 hex digest, as S3 uses for objects
+    uploaded in one part, so archived and S3 tiles revalidate alike.
+    """
+    return hashlib.md5(content).hexdigest()
+
+
+def write_archive(path, tiles, metadata):
+    """
+    Write an MBTiles archive atomically.
+
+    Tile rows are stored as given: the pyramids in S3 already use the
+    TMS row numbering that MBTiles expects.
+
+    Parameters:
+    - path (str): Archive file to create or replace.
+    - tiles (iterable): (z, x, y, png bytes) of each tile.
+    - metadata (dict): MBTiles metadata name -> value.
+    """
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    handle, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.',
+                                        suffix=ARCHIVE_SUFFIX)
+    os.close(handle)
+    try:
+        connection = sqlite3.connect(tmp_path)
+        try:
+            for statement in SCHEMA:
+                connection.execute(statement)
+            connection.executemany(
+                'INSERT INTO metadata (name, value) VALUES (?, ?)',
+                [(name, str(value)) for name, value in metadata.items()])
+            connection.executemany(
+                'INSERT INTO tiles (zoom_level, tile_column, tile_row, '
+                'tile_data) VALUES (?, ?, ?, ?)',
+                ((int(z), int(x), int(y), sqlite3.Binary(content))
+                 for z, x, y, content in tiles))
+            connection.commit()
+        finally:
+            connection.close()
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+class TileArchive:
+    """
+    Serve pair tiles from local MBTiles archives, one file per pair at
+    {directory}/{site}/{beam}/{pair}.mbtiles.
+
+    A tile is a single indexed read from one local file, so a pair with
+    an archive needs neither the network nor the tile caches. Each
+    thread keeps its own read-only SQLite connection per archive, and
+    opens a new one when the archive file is replaced.
+
+    Parameters:
+    - directory (str): Root directory of the archives.
+    """
+
+    def __init__(self, directory=TILE_ARCHIVE_DIR):
+        self.directory = directory
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def path(self, site, beam, pair):
+        """Return the archive path of a pair, or None for invalid names."""
+        names = (site, beam, pair)
+        if not self.directory or not all(
+                name and NAME_PATTERN.match(name) for name in names):
+            return None
+        return os.path.join(self.directory, site, beam,
+                            f'{pair}{ARCHIVE_SUFFIX}')
+
+    def has_pair(self, site, beam, pair):
+        """Return True if an archive exists for the pair."""
+        path = self.path(site, beam, pair)
+        return path is not None and os.path.isfile(path)
+
+    def pairs(self, site, beam):
+        """Return the pairs archived for a site/beam."""
+        path = self.path(site, beam, 'pair')
+        if path is None:
+            return []
+        try:
+            names = os.listdir(os.path.dirname(path))
+        except OSError:
+            return []
+        return sorted(name[:-len(ARCHIVE_SUFFIX)] for name in names
+                      if name.endswith(ARCHIVE_SUFFIX))
+
+    def _connection(self, path, stamp):
+        """Connection to the archive at path as of its file stamp."""
+        connections = getattr(self._local, 'connections', None)
+        if connections is None:
+            connections = self._local.connections = {}
+        cached = connections.get(path)
+        if cached is not None and cached[1] == stamp:
+            return cached[0]
+        if cached is not None:
+            # replaced (e.g. repacked): the old inode is stale
+            cached[0].close()
+        connection = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+        connections[path] = (connection, stamp)
+        return connection
+
+    def load(self, site, beam, pair, z, x, y):
+        """
+        Return (status, Tile) of a tile of an archived pair, (404, None)
+        if the archive does not contain it, or None if the pair has no
+        archive.
+        """
+        path = self.path(site, beam, pair)
+        stamp = None if path is None else file_stamp(path)
+        if stamp is None:
+            return None
+        try:
+            row = self._connection(path, stamp).execute(
+                'SELECT tile_data FROM tiles WHERE zoom_level = ? '
+                'AND tile_column = ? AND tile_row = ?',
+                (int(z), int(x), int(y))).fetchone()
+        except sqlite3.Error as exception:
+            logger.warning('Tile archive %s unreadable: %s', path, exception)
+            return None
+        with self._lock:
+            if row is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if row is None:
+            return 404, None
+        content = bytes(row[0])
+        return 200, Tile(content, tile_etag(content))
+
+    def stats(self):
+        """Return counters."""
+        with self._lock:
+            return {
+                'directory': self.directory,
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+
+tile_archive = TileArchive()
@@ -0,0 +1,375 @@
+#!/usr/bin/python3
+"""
+Volcano InSAR Interpretation Workbench
+
+Two-tier (memory + on-disk) LRU cache for interferogram tiles
+
+SPDX-License-Identifier: MIT
+
+Copyright (C) 2021-2024 Government of Canada
+
+Authors:
+  - Drew Rotheram <drew.rotheram-clarke@nrcan-rncan.gc.ca>
+"""
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from global_variables import (
+    TILE_CACHE_DIR,
+    TILE_CACHE_DISK_MB,
+    TILE_CACHE_MEMORY_ITEMS,
+    TILE_CACHE_MEMORY_MB,
+    TILE_CACHE_PRUNE_FRACTION,
+    TILE_NEGATIVE_ITEMS,
+    TILE_NEGATIVE_TTL
+)
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+
+# tile bytes with the S3 object ETag (unquoted, may be None)
+Tile = namedtuple('Tile', ['content', 'etag'])
+
+
+def tile_key(bucket, site, beam, pair, z, x, y):
+    """Cache key of a tile: (bucket, site, beam, pair, z, x, y)."""
+    return (bucket, site, beam, pair, int(z), int(x), int(y))
+
+
+def content_size(value):
+    """Size of a Tile in bytes."""
+    return len(value.content)
+
+
+def encode_tile(tile):
+    """File contents of a Tile: its ETag on the first line, then bytes."""
+    return f'{tile.etag or ""}\n'.encode('utf-8') + tile.content
+
+
+def decode_tile(data):
+    """Inverse of encode_tile."""
+    etag, _, content = data.partition(b'\n')
+    return Tile(content, etag.decode('utf-8') or None)
+
+
+class MemoryLRU:
+    """
+    In-process LRU of tiles, bounded by total size and item count.
+
+    Parameters:
+    - max_bytes (int): Total size of cached values. 0 disables the tier.
+    - max_items (int): Number of cached values.
+    - sizeof (callable): Size in bytes of a value.
+    """
+
+    def __init__(self, max_bytes, max_items, sizeof=content_size):
+        self.max_bytes = max_bytes
+        self.max_items = max_items
+        self._sizeof = sizeof
+        self._items = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """Return the cached value for key, or None."""
+        with self._lock:
+            value = self._items.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        """Cache value under key, evicting least recently used values."""
+        size = self._sizeof(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self._bytes -= self._sizeof(old)
+            self._items[key] = value
+            self._bytes += size
+            while self._full():
+                _, evicted = self._items.popitem(last=False)
+                self._bytes -= self._sizeof(evicted)
+                self.evictions += 1
+
+    def _full(self):
+        too_big = self._bytes > self.max_bytes
+        return too_big or len(self._items) > self.max_items
+
+    def stats(self):
+        """Return counters and current size."""
+        with self._lock:
+            return {
+                'items': len(self._items),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+
+class DiskLRU:
+    """
+    On-disk LRU of tiles shared by every worker on the host.
+
+    Each value is stored in its own file, encoded by encode (by default
+    a tile as its ETag on the first line followed by the tile bytes).
+    Files are written atomically (temporary file + rename),
+    so workers can read and write the same directory concurrently. Reads
+    refresh the file modification time, which orders eviction. When the
+    directory grows past max_bytes, the oldest files are removed until
+    it is back under prune_fraction * max_bytes.
+
+    Requests only keep an estimate of the directory size; rescanning it
+    (to count files written by other workers) and pruning run on a
+    background thread, woken every RESCAN_EVERY puts or when the estimate
+    goes past max_bytes.
+
+    Parameters:
+    - directory (str): Cache directory.
+    - max_bytes (int): Total size of cached files. 0 disables the tier.
+    - prune_fraction (float): Fraction of max_bytes to prune down to.
+    - encode (callable): Bytes stored for a value.
+    - decode (callable): Value of stored bytes.
+    """
+    RESCAN_EVERY = 256
+
+    def __init__(self, directory, max_bytes, prune_fraction,
+                 encode=encode_tile, decode=decode_tile):
+        self.directory = directory
+        self._encode = encode
+        self._decode = decode
+        self.max_bytes = max_bytes
+        self.prune_fraction = prune_fraction
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self._since_scan = 0
+        self._puts = 0
+        self._wakeup = threading.Event()
+        self._thread = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _path(self, key):
+        digest = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, digest[:2], f'{digest}.tile')
+
+    def get(self, key):
+        """Return the cached value for key, or None."""
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as tile_file:
+                value = self._decode(tile_file.read())
+            os.utime(path)
+        except OSError:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return value
+
+    def put(self, key, value):
+        """Cache value under key, pruning the directory when full."""
+        data = self._encode(value)
+        if len(data) > self.max_bytes:
+            return
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            handle, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+            with os.fdopen(handle, 'wb') as tile_file:
+                tile_file.write(data)
+            os.replace(tmp_path, path)
+        except OSError as exception:
+            logger.warning('Tile cache write failed: %s', exception)
+            return
+        with self._lock:
+            # the first put also scans, to count the existing files
+            due = self._puts % self.RESCAN_EVERY == 0
+            self._puts += 1
+            self._bytes += len(data)
+            self._since_scan += len(data)
+            due = due or self._bytes > self.max_bytes
+            if due and self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name='disk-lru', daemon=True)
+                self._thread.start()
+        if due:
+            self._wakeup.set()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait()
+            self._wakeup.clear()
+            self._rescan()
+
+    def _rescan(self):
+        """Measure the directory, pruning it if it is full."""
+        with self._lock:
+            self._since_scan = 0
+        files = self._files()
+        total = sum(size for _, size, _ in files)
+        if total > self.max_bytes:
+            total = self._prune(files, total)
+        with self._lock:
+            # puts made during the scan may not have been counted
+            self._bytes = total + self._since_scan
+
+    def _files(self):
+        files = []
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+        return files
+
+    def _prune(self, files, total):
+        """Remove the oldest files until under the target; new total."""
+        target = self.max_bytes * self.prune_fraction
+        removed = 0
+        for _, size, path in sorted(files):
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        with self._lock:
+            self.evictions += removed
+        logger.info('Tile cache pruned to %s bytes', total)
+        return total
+
+    def stats(self):
+        """Return counters and current (approximate) size."""
+        with self._lock:
+            return {
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+
+class TileCache:
+    """
+    Memory tier in front of a disk tier (of tiles unless the tiers are
+    given other value types). Disk hits are promoted to memory; either
+    tier is skipped when its size limit is 0.
+    """
+
+    def __init__(self, memory, disk):
+        self.memory = memory if memory.max_bytes > 0 else None
+        self.disk = disk if disk.max_bytes > 0 else None
+
+    def get(self, key):
+        """Return the cached value for key, or None."""
+        if self.memory is not None:
+            value = self.memory.get(key)
+            if value is not None:
+                return value
+        if self.disk is not None:
+            value = self.disk.get(key)
+            if value is not None:
+                if self.memory is not None:
+                    self.memory.put(key, value)
+                return value
+        return None
+
+    def put(self, key, value):
+        """Cache a value in both tiers."""
+        if self.memory is not None:
+            self.memory.put(key, value)
+        if self.disk is not None:
+            self.disk.put(key, value)
+
+    def stats(self):
+        """Return counters for both tiers."""
+        return {
+            'memory': self.memory.stats() if self.memory else None,
+            'disk': self.disk.stats() if self.disk else None,
+        }
+
+
+class NegativeCache:
+    """
+    Remember tiles missing from S3 for a limited time, so tiles outside
+    the processed footprint are not requested again on every pan.
+
+    Parameters:
+    - ttl (float): Seconds a missing tile is remembered; tiles may be
+        generated later, so this should stay short.
+    - max_items (int): Number of remembered tiles.
+    """
+
+    def __init__(self, ttl, max_items):
+        self.ttl = ttl
+        self.max_items = max_items
+        self._expiry = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.added = 0
+        self.expired = 0
+
+    def add(self, key):
+        """Remember key as missing."""
+        with self._lock:
+            self._expiry[key] = time.monotonic() + self.ttl
+            self._expiry.move_to_end(key)
+            while len(self._expiry) > self.max_items:
+                self._expiry.popitem(last=False)
+            self.added += 1
+
+    def contains(self, key):
+        """Return True if key is known to be missing."""
+        with self._lock:
+            expiry = self._expiry.get(key)
+            if expiry is None:
+                return False
+            if expiry < time.monotonic():
+                del self._expiry[key]
+                self.expired += 1
+                return False
+            self.hits += 1
+            return True
+
+    def stats(self):
+        """Return counters and current size."""
+        with self._lock:
+            return {
+                'items': len(self._expiry),
+                'hits': self.hits,
+                'added': self.added,
+                'expired': self.expired,
+            }
+
+
+tile_cache = TileCache(
+    MemoryLRU(TILE_CACHE_MEMORY_MB * MB, TILE_CACHE_MEMORY_ITEMS),
+    DiskLRU(TILE_CACHE_DIR, TILE_CACHE_DISK_MB * MB,
+            TILE_CACHE_PRUNE_FRACTION)
+)
+tile_missing = NegativeCache(TILE_NEGATIVE_TTL, TILE_NEGATIVE_ITEMS)
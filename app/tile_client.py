@@ -0,0 +1,187 @@
+#!/usr/bin/python3
+"""
+Volcano InSAR Interpretation Workbench
+
+Shared keep-alive HTTP client used by the tile proxy to reach S3
+
+SPDX-License-Identifier: MIT
+
+Copyright (C) 2021-2024 Government of Canada
+
+Authors:
+  - Drew Rotheram <drew.rotheram-clarke@nrcan-rncan.gc.ca>
+"""
+import logging
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from global_variables import (
+    TILE_MAX_IN_FLIGHT,
+    TILE_POOL_BLOCK,
+    TILE_POOL_SIZE,
+    TILE_TIMEOUT
+)
+
+logger = logging.getLogger(__name__)
+
+
+class TileClient:
+    """
+    Pooled HTTP client for upstream tile requests.
+
+    All threads of a worker share a single urllib3 connection pool, so
+    consecutive tiles reuse open TCP/TLS connections instead of
+    handshaking with S3 for every request. Each thread gets its own
+    requests.Session (sessions are not thread-safe) mounted on the
+    shared adapter.
+
+    Parameters:
+    - pool_size (int): Maximum number of connections kept open per host.
+    - pool_block (bool): Wait for a free connection when the pool is
+        exhausted rather than opening (and discarding) extra ones.
+    - timeout (float): Timeout in seconds for each upstream request.
+    - max_in_flight (int): Upstream requests allowed at once across all
+        hosts; further requests wait up to timeout for a slot.
+    """
+
+    def __init__(self, pool_size=TILE_POOL_SIZE, pool_block=TILE_POOL_BLOCK,
+                 timeout=TILE_TIMEOUT, max_in_flight=TILE_MAX_IN_FLIGHT):
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.max_in_flight = max_in_flight
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self._adapter = HTTPAdapter(pool_connections=4,
+                                    pool_maxsize=pool_size,
+                                    pool_block=pool_block)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._requests = 0
+        self._saturated = 0
+
+    def _session(self):
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            # verify = False for when working in office
+            # to bypass SSL Certificate Error
+            session.verify = False
+            session.mount('http://', self._adapter)
+            session.mount('https://', self._adapter)
+            self._local.session = session
+        return session
+
+    def get(self, url, **kwargs):
+        """GET a url through the shared connection pool."""
+        return self._request('GET', url, **kwargs)
+
+    def head(self, url, **kwargs):
+        """HEAD a url through the shared connection pool."""
+        return self._request('HEAD', url, **kwargs)
+
+    def _request(self, method, url, **kwargs):
+        if not self._slots.acquire(timeout=self.timeout):
+            raise requests.exceptions.ConnectionError(
+                f'More than {self.max_in_flight} upstream tile requests '
+                'in flight')
+        with self._lock:
+            self._in_flight += 1
+            self._requests += 1
+            in_flight = self._in_flight
+            saturated = in_flight > self.pool_size
+            if saturated:
+                self._saturated += 1
+        if saturated:
+            logger.warning('Tile pool saturated: %s requests for %s '
+                           'connections', in_flight, self.pool_size)
+        try:
+            return self._session().request(method, url,
+                                           timeout=self.timeout, **kwargs)
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+            self._slots.release()
+
+    def stats(self):
+        """
+        Return connection pool counters.
+
+        Returns:
+        - dict: Requests made, connections opened and reused, current
+            in-flight requests and how often the pool was saturated.
+        """
+        opened = 0
+        pool_requests = 0
+        pools = self._adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is not None:
+                opened += pool.num_connections
+                pool_requests += pool.num_requests
+        with self._lock:
+            return {
+                'pool_size': self.pool_size,
+                'max_in_flight': self.max_in_flight,
+                'requests': self._requests,
+                'in_flight': self._in_flight,
+                'saturated': self._saturated,
+                'connections_opened': opened,
+                'connections_reused': max(pool_requests - opened, 0),
+            }
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls for the same key into a single call.
+
+    The first caller for a key runs the function; callers arriving while
+    it runs wait for and share its result (or exception).
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.coalesced = 0
+
+    def do(self, key, function):
+        """Return function(), shared with concurrent callers for key."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = {'done': threading.Event()}
+                self._calls[key] = call
+                self.calls += 1
+            else:
+                self.coalesced += 1
+        if not leader:
+            call['done'].wait()
+            if 'error' in call:
+                raise call['error']
+            return call['result']
+        try:
+            call['result'] = function()
+            return call['result']
+        except Exception as exception:
+            call['error'] = exception
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call['done'].set()
+
+    def stats(self):
+        """Return counters and current in-flight keys."""
+        with self._lock:
+            return {
+                'in_flight': len(self._calls),
+                'calls': self.calls,
+                'coalesced': self.coalesced,
+            }
+
+
+tile_client = TileClient()
+tile_flights = SingleFlight()
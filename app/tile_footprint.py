@@ -0,0 +1,117 @@
+#!/usr/bin/python3
+"""
+Volcano InSAR Interpretation Workbench
+
+Tile ranges of the target footprints, to answer tiles outside them
+without looking them up
+
+SPDX-License-Identifier: MIT
+
+Copyright (C) 2021-2024 Government of Canada
+
+Authors:
+  - Drew Rotheram <drew.rotheram-clarke@nrcan-rncan.gc.ca>
+"""
+import threading
+
+from global_variables import TILE_FOOTPRINT_MARGIN, TILE_FOOTPRINT_MAX_ZOOM
+from tile_inventory import tiles_in_bounds
+
+
+def polygon_bounds(coordinates):
+    """
+    Return (south, west, north, east) of GeoJSON polygon coordinates,
+    at any nesting depth ([lon, lat] points, rings or polygons).
+    """
+    points = []
+    stack = [coordinates]
+    while stack:
+        item = stack.pop()
+        if len(item) >= 2 and all(isinstance(v, (int, float))
+                                  for v in item[:2]):
+            points.append(item)
+        else:
+            stack.extend(item)
+    lons = [point[0] for point in points]
+    lats = [point[1] for point in points]
+    return min(lats), min(lons), max(lats), max(lons)
+
+
+class TileFootprints:
+    """
+    Per-site (x_min, x_max, y_min, y_max) tile ranges of the target
+    polygons, for each zoom level.
+
+    Sites without a known footprint are not restricted.
+
+    Parameters:
+    - margin (int): Tiles kept around the footprint at every zoom.
+    - max_zoom (int): Highest zoom whose ranges are precomputed; ranges
+        of higher zooms are computed on request.
+    """
+
+    def __init__(self, margin=TILE_FOOTPRINT_MARGIN,
+                 max_zoom=TILE_FOOTPRINT_MAX_ZOOM):
+        self.margin = margin
+        self.max_zoom = max_zoom
+        self._bounds = {}
+        self._ranges = {}
+        self._lock = threading.Lock()
+        self.accepted = 0
+        self.rejected = 0
+
+    def add(self, site, coordinates):
+        """Add a target polygon to the footprint of a site."""
+        south, west, north, east = polygon_bounds(coordinates)
+        with self._lock:
+            known = self._bounds.get(site)
+            if known is not None:
+                south, west = min(south, known[0]), min(west, known[1])
+                north, east = max(north, known[2]), max(east, known[3])
+            bounds = (south, west, north, east)
+            self._bounds[site] = bounds
+            self._ranges[site] = [self._tile_range(bounds, z)
+                                  for z in range(self.max_zoom + 1)]
+
+    def _tile_range(self, bounds, z):
+        x_min, x_max, y_min, y_max = tiles_in_bounds(bounds, z)
+        last = 2 ** z - 1
+        return (max(x_min - self.margin, 0), min(x_max + self.margin, last),
+                max(y_min - self.margin, 0), min(y_max + self.margin, last))
+
+    def tile_range(self, site, z):
+        """Return the tile range of a site at zoom z, or None if unknown."""
+        with self._lock:
+            ranges = self._ranges.get(site)
+            bounds = self._bounds.get(site)
+        if ranges is None:
+            return None
+        if z < len(ranges):
+            return ranges[z]
+        return self._tile_range(bounds, z)
+
+    def contains(self, site, z, x, y):
+        """Return True unless the (TMS) tile is outside the site footprint."""
+        tile_range = self.tile_range(site, int(z))
+        if tile_range is None:
+            return True
+        x_min, x_max, y_min, y_max = tile_range
+        inside = x_min <= int(x) <= x_max and y_min <= int(y) <= y_max
+        with self._lock:
+            if inside:
+                self.accepted += 1
+            else:
+                self.rejected += 1
+        return inside
+
+    def stats(self):
+        """Return counters and the number of sites with a footprint."""
+        with self._lock:
+            return {
+                'sites': len(self._bounds),
+                'accepted': self.accepted,
+                'rejected': self.rejected,
+            }
+
+
+tile_footprints = TileFootprints()
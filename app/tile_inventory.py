@@ -0,0 +1,259 @@
+#!/usr/bin/python3
+"""
+Volcano InSAR Interpretation Workbench
+
+In-memory index of the interferogram tile pyramids available in S3
+
+SPDX-License-Identifier: MIT
+
+Copyright (C) 2021-2024 Government of Canada
+
+Authors:
+  - Drew Rotheram <drew.rotheram-clarke@nrcan-rncan.gc.ca>
+"""
+import logging
+import math
+import re
+import threading
+import time
+from collections import namedtuple
+
+import botocore.exceptions
+
+from global_variables import (
+    TILE_INVENTORY_MISS_TTL,
+    TILE_INVENTORY_REFRESH,
+    s3
+)
+
+logger = logging.getLogger(__name__)
+
+PAIR_PATTERN = re.compile(r'^\d{8}_\d{8}$')
+
+# zoom range of a pair pyramid and its (south, west, north, east) bounds
+PairInfo = namedtuple('PairInfo', ['min_zoom', 'max_zoom', 'bounds'])
+
+
+def tile_bounds(z, x, y, tms=True):
+    """Return (south, west, north, east) in degrees of a map tile."""
+    count = 2 ** z
+    if tms:
+        y = count - 1 - y
+
+    def lat(row):
+        mercator_y = math.pi * (1 - 2 * row / count)
+        return math.degrees(math.atan(math.sinh(mercator_y)))
+
+    return (lat(y + 1), x / count * 360 - 180,
+            lat(y), (x + 1) / count * 360 - 180)
+
+
+def tiles_in_bounds(bounds, z, tms=True):
+    """
+    Return the (x_min, x_max, y_min, y_max) tile range covering
+    (south, west, north, east) bounds in degrees at zoom z.
+    """
+    south, west, north, east = bounds
+    count = 2 ** z
+
+    def column(lon):
+        return min(max(int((lon + 180) / 360 * count), 0), count - 1)
+
+    def row(lat):
+        lat = min(max(lat, -85.0511), 85.0511)
+        mercator_y = math.asinh(math.tan(math.radians(lat)))
+        index = int((1 - mercator_y / math.pi) / 2 * count)
+        index = min(max(index, 0), count - 1)
+        return count - 1 - index if tms else index
+
+    rows = sorted((row(south), row(north)))
+    return column(west), column(east), rows[0], rows[1]
+
+
+class TileInventory:
+    """
+    Index of {site}/{beam}/{start}_{end} tile prefixes in the tiles bucket.
+
+    Pair presence per site/beam is refreshed from a periodic S3 listing;
+    the zoom range and bounds of each pair are filled in once, since a
+    pyramid never changes after it is generated. Lookups are dictionary
+    reads. A site/beam not yet seen by the refresh is listed on demand.
+    A pair not in the index (processed since the last refresh, or the
+    listing was denied) is checked on its own in S3; found pairs are
+    added to the index, missing ones are not checked again for
+    TILE_INVENTORY_MISS_TTL seconds.
+
+    Parameters:
+    - client (botocore.client.S3): Client used for listing.
+    - refresh_interval (float): Seconds between full listings.
+    """
+
+    def __init__(self, client, refresh_interval=TILE_INVENTORY_REFRESH):
+        self.client = client
+        self.refresh_interval = refresh_interval
+        self.bucket = None
+        self._pairs = {}
+        self._misses = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self.last_refresh = None
+        self.refresh_seconds = None
+
+    def start(self, bucket):
+        """Keep the index of bucket fresh from a background thread."""
+        self.bucket = bucket
+        if self._thread is None and bucket:
+            self._thread = threading.Thread(target=self._run, daemon=True,
+                                            name='tile-inventory')
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                self.refresh()
+            except (botocore.exceptions.BotoCoreError,
+                    botocore.exceptions.ClientError) as exception:
+                logger.warning('Tile inventory refresh failed: %s',
+                               exception)
+            except Exception:  # pylint: disable=broad-exception-caught
+                # keep refreshing: a dead thread leaves the index stale
+                logger.exception('Tile inventory refresh failed')
+            time.sleep(self.refresh_interval)
+
+    def _prefixes(self, prefix):
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix,
+                                       Delimiter='/'):
+            for common in page.get('CommonPrefixes', []):
+                yield common['Prefix'][len(prefix):].rstrip('/')
+
+    def _list_pairs(self, site, beam):
+        return [pair for pair in self._prefixes(f'{site}/{beam}/')
+                if PAIR_PATTERN.match(pair)]
+
+    def _pair_info(self, site, beam, pair):
+        prefix = f'{site}/{beam}/{pair}/'
+        zooms = sorted(int(z) for z in self._prefixes(prefix) if z.isdigit())
+        if not zooms:
+            return None
+        tiles = []
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket,
+                                       Prefix=f'{prefix}{zooms[0]}/'):
+            for obj in page.get('Contents', []):
+                x, y = obj['Key'].rsplit('/', 2)[-2:]
+                if x.isdigit() and y.endswith('.png'):
+                    tiles.append((int(x), int(y[:-4])))
+        if not tiles:
+            return PairInfo(zooms[0], zooms[-1], None)
+        xs, ys = zip(*tiles)
+        south, west, _, _ = tile_bounds(zooms[0], min(xs), min(ys))
+        _, _, north, east = tile_bounds(zooms[0], max(xs), max(ys))
+        return PairInfo(zooms[0], zooms[-1], (south, west, north, east))
+
+    def refresh(self):
+        """List the whole bucket and update the index."""
+        start = time.perf_counter()
+        count = 0
+        for site in list(self._prefixes('')):
+            for beam in list(self._prefixes(f'{site}/')):
+                with self._lock:
+                    known = self._pairs.get((site, beam), {})
+                pairs = {pair: known.get(pair)
+                         for pair in self._list_pairs(site, beam)}
+                with self._lock:
+                    self._pairs[(site, beam)] = pairs
+                # a snapshot: has_pair may add probed pairs meanwhile
+                for pair, info in list(pairs.items()):
+                    if info is None:
+                        pairs[pair] = self._pair_info(site, beam, pair)
+                count += len(pairs)
+        self.last_refresh = time.time()
+        self.refresh_seconds = time.perf_counter() - start
+        logger.info('Tile inventory: %s pairs in %.1f s',
+                    count, self.refresh_seconds)
+
+    def _beam_pairs(self, site, beam):
+        with self._lock:
+            pairs = self._pairs.get((site, beam))
+        if pairs is not None or not self.bucket:
+            return pairs or {}
+        try:
+            pairs = dict.fromkeys(self._list_pairs(site, beam))
+        except botocore.exceptions.BotoCoreError as exception:
+            logger.warning('Tile inventory listing failed: %s', exception)
+            return {}
+        except botocore.exceptions.ClientError as exception:
+            # e.g. no ListBucket: rely on the checks of single pairs
+            logger.warning('Tile inventory listing failed: %s', exception)
+            pairs = {}
+        with self._lock:
+            return self._pairs.setdefault((site, beam), pairs)
+
+    def _probe(self, site, beam, pair):
+        """
+        Check a single pair in S3: list one key under its prefix or, if
+        listing is denied, HEAD its zoom 0 tile.
+        """
+        prefix = f'{site}/{beam}/{pair}/'
+        try:
+            response = self.client.list_objects_v2(
+                Bucket=self.bucket, Prefix=prefix, MaxKeys=1)
+            return response.get('KeyCount', 0) > 0
+        except botocore.exceptions.ClientError:
+            pass
+        try:
+            self.client.head_object(Bucket=self.bucket,
+                                    Key=f'{prefix}0/0/0.png')
+        except botocore.exceptions.ClientError:
+            return False
+        return True
+
+    def has_pair(self, site, beam, pair):
+        """Return True if tiles exist for the pair."""
+        if pair in self._beam_pairs(site, beam):
+            return True
+        if not self.bucket:
+            return False
+        now = time.monotonic()
+        with self._lock:
+            if self._misses.get((site, beam, pair), 0) > now:
+                return False
+        try:
+            exists = self._probe(site, beam, pair)
+        except botocore.exceptions.BotoCoreError as exception:
+            logger.warning('Tile inventory check of %s failed: %s',
+                           pair, exception)
+            return False
+        with self._lock:
+            self._misses = {key: expiry for key, expiry
+                            in self._misses.items() if expiry > now}
+            if exists:
+                self._pairs.setdefault((site, beam), {}).setdefault(pair)
+            else:
+                self._misses[(site, beam, pair)] = (
+                    now + TILE_INVENTORY_MISS_TTL)
+        return exists
+
+    def pairs(self, site, beam):
+        """Return the pairs with tiles for a site/beam."""
+        return list(self._beam_pairs(site, beam))
+
+    def pair_info(self, site, beam, pair):
+        """Return the PairInfo of a pair, or None if not known yet."""
+        return self._beam_pairs(site, beam).get(pair)
+
+    def stats(self):
+        """Return index size and refresh timings."""
+        with self._lock:
+            pairs = sum(len(pairs) for pairs in self._pairs.values())
+            beams = len(self._pairs)
+        return {
+            'beams': beams,
+            'pairs': pairs,
+            'last_refresh': self.last_refresh,
+            'refresh_seconds': self.refresh_seconds,
+        }
+
+
+tile_inventory = TileInventory(s3)
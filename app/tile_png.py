@@ -0,0 +1,55 @@
+#!/usr/bin/python3
+"""
+Volcano InSAR Interpretation Workbench
+
+Minimal PNG encoding for generated map tiles
+
+SPDX-License-Identifier: MIT
+
+Copyright (C) 2021-2024 Government of Canada
+
+Authors:
+  - Drew Rotheram <drew.rotheram-clarke@nrcan-rncan.gc.ca>
+"""
+import struct
+import zlib
+
+TILE_SIZE = 256
+
+
+def _chunk(kind, data):
+    crc = zlib.crc32(kind + data) & 0xffffffff
+    return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', crc)
+
+
+def encode_png(pixels, width, height, level=6):
+    """
+    Encode 8-bit RGBA pixels as a PNG.
+
+    Parameters:
+    - pixels (bytes): Row-major RGBA bytes, width * height * 4 long.
+    - width (int): Image width in pixels.
+    - height (int): Image height in pixels.
+    - level (int): zlib compression level.
+
+    Returns:
+    - bytes: The PNG file.
+    """
+    stride = width * 4
+    # filter type 0 (None) at the start of every scanline
+    raw = b''.join(
+        b'\x00' + pixels[row * stride:(row + 1) * stride]
+        for row in range(height)
+    )
+    header = struct.pack('>IIBBBBB', width, height, 8, 6, 0, 0, 0)
+    return b''.join((
+        b'\x89PNG\r\n\x1a\n',
+        _chunk(b'IHDR', header),
+        _chunk(b'IDAT', zlib.compress(raw, level)),
+        _chunk(b'IEND', b''),
+    ))
+
+
+# shared, pre-encoded fully transparent tile
+EMPTY_TILE_PNG = encode_png(bytes(TILE_SIZE * TILE_SIZE * 4),
+                            TILE_SIZE, TILE_SIZE, level=9)
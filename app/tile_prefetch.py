@@ -0,0 +1,207 @@
+#!/usr/bin/python3
+"""
+Volcano InSAR Interpretation Workbench
+
+Background prefetching of interferogram tiles for a selected pair
+
+SPDX-License-Identifier: MIT
+
+Copyright (C) 2021-2024 Government of Canada
+
+Authors:
+  - Drew Rotheram <drew.rotheram-clarke@nrcan-rncan.gc.ca>
+"""
+import itertools
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import requests
+
+from global_variables import (
+    TILE_MODE,
+    TILE_PREFETCH_MAX_TILES,
+    TILE_PREFETCH_WORKERS
+)
+from tile_archive import tile_archive
+from tile_footprint import tile_footprints
+from tile_inventory import tile_inventory, tiles_in_bounds
+from tile_service import load_tile
+
+logger = logging.getLogger(__name__)
+
+
+class TilePrefetcher:
+    """
+    Warm the tile caches from a bounded pool of background threads.
+
+    Each prefetch belongs to a scope (the browser session that selected
+    the pair). Starting a new prefetch in a scope, or cancelling the
+    scope when the session selects another target, drops whatever is
+    still queued for the previous selection in that scope.
+
+    Parameters:
+    - load (callable): Loads one tile given its cache key fields.
+    - max_workers (int): Threads fetching tiles.
+    - max_tiles (int): Tiles queued per prefetch.
+    """
+
+    def __init__(self, load=load_tile, max_workers=TILE_PREFETCH_WORKERS,
+                 max_tiles=TILE_PREFETCH_MAX_TILES):
+        self._load = load
+        self.max_tiles = max_tiles
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix='tile-prefetch')
+        self._generation = itertools.count(1)
+        self._generations = {}
+        self._futures = {}
+        self._lock = threading.Lock()
+        self.counts = {'submitted': 0, 'fetched': 0, 'cancelled': 0}
+
+    def prefetch(self, scope, tiles):
+        """
+        Replace the prefetch running in scope with tiles.
+
+        Parameters:
+        - scope (hashable): Selection the tiles belong to.
+        - tiles (iterable): (bucket, site, beam, pair, z, x, y) tuples,
+            most important first.
+        """
+        tiles = list(dict.fromkeys(tiles))[:self.max_tiles]
+        with self._lock:
+            self._cancel(scope)
+            # forget the scopes whose prefetch is over
+            for done in [other for other, futures in self._futures.items()
+                         if all(future.done() for future in futures)]:
+                self._forget(done)
+            generation = next(self._generation)
+            self._generations[scope] = generation
+            self._futures[scope] = [
+                self._executor.submit(self._run, scope, generation, tile)
+                for tile in tiles
+            ]
+            self.counts['submitted'] += len(tiles)
+
+    def cancel(self, scope):
+        """Drop the tiles still queued in scope."""
+        with self._lock:
+            self._cancel(scope)
+
+    def _cancel(self, scope):
+        # called with self._lock held
+        for future in self._futures.get(scope, []):
+            if future.cancel():
+                self.counts['cancelled'] += 1
+        self._forget(scope)
+
+    def _forget(self, scope):
+        self._futures.pop(scope, None)
+        self._generations.pop(scope, None)
+
+    def _run(self, scope, generation, tile):
+        with self._lock:
+            if self._generations.get(scope) != generation:
+                self.counts['cancelled'] += 1
+                return
+        try:
+            self._load(*tile)
+        except requests.exceptions.RequestException as exception:
+            logger.debug('Prefetch of %s failed: %s', tile, exception)
+            return
+        with self._lock:
+            self.counts['fetched'] += 1
+
+    def stats(self):
+        """Return prefetch counters."""
+        with self._lock:
+            return dict(self.counts)
+
+
+def adjacent_pairs(pair, pairs):
+    """
+    Return the pairs next to pair in the coherence matrix: the closest
+    earlier and later pair with the same temporal baseline, and the
+    closest shorter and longer baseline ending on the same date.
+    """
+    def parse(name):
+        first, second = (datetime.strptime(date, '%Y%m%d')
+                         for date in name.split('_'))
+        return second, (second - first).days
+
+    second, delta = parse(pair)
+    parsed = [(parse(other), other) for other in pairs if other != pair]
+    same_delta = sorted((p[0], other) for p, other in parsed
+                        if p[1] == delta)
+    same_second = sorted((p[1], other) for p, other in parsed
+                         if p[0] == second)
+    neighbours = []
+    for ordered, value in ((same_delta, second), (same_second, delta)):
+        before = [other for key, other in ordered if key < value]
+        after = [other for key, other in ordered if key > value]
+        neighbours += before[-1:] + after[:1]
+    return neighbours
+
+
+def viewport_tiles(bucket, site, beam, pair, z, bounds):
+    """
+    Cache key fields of the tiles covering bounds at zoom z, within the
+    site footprint.
+    """
+    x_min, x_max, y_min, y_max = tiles_in_bounds(bounds, z)
+    footprint = tile_footprints.tile_range(site, z)
+    if footprint is not None:
+        x_min, x_max = max(x_min, footprint[0]), min(x_max, footprint[1])
+        y_min, y_max = max(y_min, footprint[2]), min(y_max, footprint[3])
+    return [(bucket, site, beam, pair, z, x, y)
+            for x in range(x_min, x_max + 1)
+            for y in range(y_min, y_max + 1)]
+
+
+def prefetch_selection(scope, bucket, site, beam, pair, zoom, bounds):
+    """
+    Prefetch the tiles a user is likely to view next after selecting a
+    pair: the viewport at the current zoom, the same viewport for the
+    adjacent pairs, then one zoom level in and out.
+
+    Parameters:
+    - scope (hashable): Session the selection belongs to; its previous
+        prefetch is cancelled.
+    - zoom (int): Current map zoom.
+    - bounds (tuple or None): Viewport (south, west, north, east); the
+        pair bounds from the tile inventory are used when missing.
+    """
+    tile_prefetcher.cancel(scope)
+    if TILE_MODE == 'redirect' or tile_archive.has_pair(site, beam, pair):
+        return
+    info = tile_inventory.pair_info(site, beam, pair)
+    if info is not None and info.bounds is not None:
+        if bounds is None:
+            bounds = info.bounds
+        else:
+            # only the part of the viewport that has tiles
+            bounds = (max(bounds[0], info.bounds[0]),
+                      max(bounds[1], info.bounds[1]),
+                      min(bounds[2], info.bounds[2]),
+                      min(bounds[3], info.bounds[3]))
+            if bounds[0] > bounds[2] or bounds[1] > bounds[3]:
+                return
+    if bounds is None or zoom is None:
+        return
+    zoom = int(zoom)
+
+    def has_zoom(z):
+        return info is None or info.min_zoom <= z <= info.max_zoom
+
+    tiles = []
+    if has_zoom(zoom):
+        tiles += viewport_tiles(bucket, site, beam, pair, zoom, bounds)
+        for other in adjacent_pairs(pair, tile_inventory.pairs(site, beam)):
+            tiles += viewport_tiles(bucket, site, beam, other, zoom, bounds)
+    for z in (zoom + 1, zoom - 1):
+        if has_zoom(z) and z >= 0:
+            tiles += viewport_tiles(bucket, site, beam, pair, z, bounds)
+    tile_prefetcher.prefetch(scope, tiles)
+
+
+tile_prefetcher = TilePrefetcher()
@@ -0,0 +1,313 @@
+#!/usr/bin/python3
+"""
+Volcano InSAR Interpretation Workbench
+
+On-demand rendering of interferogram tiles from the processed rasters
+
+SPDX-License-Identifier: MIT
+
+Copyright (C) 2021-2024 Government of Canada
+
+Authors:
+  - Drew Rotheram <drew.rotheram-clarke@nrcan-rncan.gc.ca>
+"""
+import logging
+import math
+import os
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+import botocore.exceptions
+import numpy as np
+import plotly.colors
+import rasterio
+from rasterio.enums import Resampling
+from rasterio.vrt import WarpedVRT
+from rasterio.windows import Window
+
+from global_variables import (
+    TILE_NEGATIVE_TTL,
+    TILE_RENDER_CACHE_ITEMS,
+    TILE_RENDER_CACHE_MB,
+    TILE_RENDER_CMAP,
+    TILE_RENDER_DATASETS,
+    TILE_RENDER_METATILE,
+    TILE_RENDER_PATH,
+    TILE_RENDER_ROOT,
+    s3
+)
+from loader_cache import file_stamp
+from tile_archive import NAME_PATTERN, tile_etag
+from tile_cache import MB, MemoryLRU, Tile, tile_cache, tile_key, tile_missing
+from tile_client import SingleFlight
+from tile_inventory import PAIR_PATTERN, tile_bounds
+from tile_png import TILE_SIZE, encode_png
+from tile_service import cached_tile
+
+logger = logging.getLogger(__name__)
+
+# values of a raster window (NaN where there is no data) and its
+# (south, west, north, east) bounds in degrees
+RasterWindow = namedtuple('RasterWindow', ['values', 'bounds'])
+
+
+def phase_colormap(name=TILE_RENDER_CMAP, size=256):
+    """Return a (size, 4) uint8 RGBA lookup table of a plotly scale."""
+    colors = plotly.colors.sample_colorscale(
+        name, [i / (size - 1) for i in range(size)])
+    lut = np.full((size, 4), 255, dtype=np.uint8)
+    lut[:, :3] = [plotly.colors.unlabel_rgb(color) for color in colors]
+    return lut
+
+
+def colorize(phase, lut):
+    """
+    Map wrapped phase in radians to RGBA pixels; one full cycle spans
+    the (cyclic) lookup table and NaN is transparent.
+
+    Returns:
+    - numpy.ndarray: (rows, columns, 4) uint8 pixels.
+    """
+    valid = np.isfinite(phase)
+    cycle = np.mod(np.where(valid, phase, 0), 2 * np.pi) / (2 * np.pi)
+    index = np.minimum((cycle * len(lut)).astype(np.intp), len(lut) - 1)
+    pixels = lut[index]
+    pixels[~valid, 3] = 0
+    return pixels
+
+
+def sample_tile(window, z, x, y):
+    """
+    Nearest-neighbour sample of a (TMS) tile from a raster window.
+
+    Returns:
+    - numpy.ndarray: (TILE_SIZE, TILE_SIZE) float32 values, NaN outside
+        the window.
+    """
+    south, west, north, east = window.bounds
+    rows, columns = window.values.shape
+    count = 2 ** z
+    offsets = (np.arange(TILE_SIZE) + 0.5) / TILE_SIZE
+    _, tile_west, _, tile_east = tile_bounds(z, x, y)
+    lons = tile_west + offsets * (tile_east - tile_west)
+    mercator_y = np.pi * (1 - 2 * (count - 1 - y + offsets) / count)
+    lats = np.degrees(np.arctan(np.sinh(mercator_y)))
+    column = np.floor((lons - west) / (east - west) * columns).astype(np.intp)
+    row = np.floor((north - lats) / (north - south) * rows).astype(np.intp)
+    row_inside = (row >= 0) & (row < rows)
+    column_inside = (column >= 0) & (column < columns)
+    inside = row_inside[:, None] & column_inside[None, :]
+    values = window.values[np.clip(row, 0, rows - 1)[:, None],
+                           np.clip(column, 0, columns - 1)[None, :]]
+    return np.where(inside, values, np.nan).astype(np.float32)
+
+
+def _close(cached):
+    """Close a (stamp, raw, dataset) entry of the open datasets."""
+    _, raw, dataset = cached
+    if dataset is not raw:
+        dataset.close()
+    raw.close()
+
+
+class TileRenderer:
+    """
+    Render pair tiles straight from the processed wrapped interferogram
+    rasters, for pairs that have no tile pyramid yet.
+
+    Rasters are read in windows covering metatile x metatile tiles,
+    decimated to at most the output resolution, and kept in an LRU so the
+    neighbouring tiles of a viewport share one read. Rendered tiles go to
+    the tile caches like downloaded ones. Each thread keeps the last
+    max_datasets rasters open; a local raster replaced on disk (e.g.
+    reprocessed) gets a new file stamp, so its windows are read again
+    and the stale handle is closed.
+
+    Parameters:
+    - root (str): Directory or s3://bucket/prefix holding the rasters.
+    - path (str): Raster path below root, formatted with site, beam,
+        first and second (the pair dates).
+    - metatile (int): Tiles per side of a raster window.
+    - max_bytes (int): Total size of cached raster windows.
+    - max_items (int): Number of cached raster windows.
+    - max_datasets (int): Rasters kept open per thread.
+    """
+
+    def __init__(self, root=TILE_RENDER_ROOT, path=TILE_RENDER_PATH,
+                 metatile=TILE_RENDER_METATILE,
+                 max_bytes=TILE_RENDER_CACHE_MB * MB,
+                 max_items=TILE_RENDER_CACHE_ITEMS,
+                 max_datasets=TILE_RENDER_DATASETS):
+        self.root = root.rstrip('/')
+        self.path = path
+        self.metatile = metatile
+        self.max_datasets = max_datasets
+        self.lut = phase_colormap()
+        self.windows = MemoryLRU(
+            max_bytes, max_items,
+            sizeof=lambda window: window.values.nbytes)
+        self._reads = SingleFlight()
+        self._local = threading.local()
+        self._sources = {}
+        self._lock = threading.Lock()
+        self.rendered = 0
+
+    def source(self, site, beam, pair):
+        """Return the raster path (or url) of a pair, or None if invalid."""
+        valid = site and beam and NAME_PATTERN.match(f'{site}_{beam}')
+        if not valid or not PAIR_PATTERN.match(pair or ''):
+            return None
+        first, second = pair.split('_')
+        return '/'.join((self.root, self.path.format(
+            site=site, beam=beam, first=first, second=second)))
+
+    def _exists(self, source):
+        if not source.startswith('s3://'):
+            return os.path.isfile(source)
+        bucket, key = source[len('s3://'):].split('/', 1)
+        try:
+            s3.head_object(Bucket=bucket, Key=key)
+        except botocore.exceptions.ClientError:
+            return False
+        return True
+
+    def has_pair(self, site, beam, pair):
+        """
+        Return True if the raster of a pair exists. Found rasters are
+        remembered; missing ones are checked again after
+        TILE_NEGATIVE_TTL, since pairs keep being processed.
+        """
+        source = self.source(site, beam, pair)
+        if source is None:
+            return False
+        with self._lock:
+            known = self._sources.get(source)
+        if known is True:
+            return True
+        if known is not None and known > time.monotonic():
+            return False
+        exists = self._exists(source)
+        with self._lock:
+            self._sources[source] = (
+                True if exists else time.monotonic() + TILE_NEGATIVE_TTL)
+        return exists
+
+    @staticmethod
+    def _stamp(source):
+        """File stamp of a local raster; S3 rasters are not replaced."""
+        if source.startswith('s3://'):
+            return None
+        return file_stamp(source)
+
+    def _dataset(self, source, stamp):
+        """Open dataset of a raster as of its file stamp, in EPSG:4326."""
+        datasets = getattr(self._local, 'datasets', None)
+        if datasets is None:
+            datasets = self._local.datasets = OrderedDict()
+        cached = datasets.pop(source, None)
+        if cached is not None and cached[0] == stamp:
+            datasets[source] = cached
+            return cached[2]
+        if cached is not None:
+            # replaced on disk: the open handle reads the old file
+            _close(cached)
+        raw = dataset = rasterio.open(source)
+        if dataset.crs and not dataset.crs.is_geographic:
+            dataset = WarpedVRT(dataset, crs='EPSG:4326',
+                                resampling=Resampling.nearest)
+        datasets[source] = (stamp, raw, dataset)
+        while len(datasets) > self.max_datasets:
+            _close(datasets.popitem(last=False)[1])
+        return dataset
+
+    def _read_window(self, source, stamp, z, meta_x, meta_y):
+        dataset = self._dataset(source, stamp)
+        last = 2 ** z - 1
+        x_min, y_min = meta_x * self.metatile, meta_y * self.metatile
+        x_max = min(x_min + self.metatile - 1, last)
+        y_max = min(y_min + self.metatile - 1, last)
+        south, west, _, _ = tile_bounds(z, x_min, y_min)
+        _, _, north, east = tile_bounds(z, x_max, y_max)
+        inverse = ~dataset.transform
+        columns, rows = zip(inverse * (west, north), inverse * (east, south))
+        col_off = max(math.floor(min(columns)), 0)
+        row_off = max(math.floor(min(rows)), 0)
+        col_end = min(math.ceil(max(columns)), dataset.width)
+        row_end = min(math.ceil(max(rows)), dataset.height)
+        if col_end <= col_off or row_end <= row_off:
+            return None
+        window = Window(col_off, row_off, col_end - col_off,
+                        row_end - row_off)
+        # no more source pixels than the tiles will show
+        shape = (min(window.height, (y_max - y_min + 1) * TILE_SIZE),
+                 min(window.width, (x_max - x_min + 1) * TILE_SIZE))
+        data = dataset.read(1, window=window, out_shape=shape, masked=True,
+                            resampling=Resampling.nearest)
+        values = np.ma.filled(data.astype(np.float32), np.nan)
+        left, bottom, right, top = rasterio.windows.bounds(
+            window, dataset.transform)
+        return RasterWindow(values, (bottom, left, top, right))
+
+    def window(self, source, z, x, y):
+        """Return the cached RasterWindow holding a tile, or None."""
+        key = (source, self._stamp(source), z, x // self.metatile,
+               y // self.metatile)
+        window = self.windows.get(key)
+        if window is None:
+            window = self._reads.do(
+                key, lambda: self._read_window(*key))
+            if window is not None:
+                self.windows.put(key, window)
+        return window
+
+    def render(self, site, beam, pair, z, x, y):
+        """
+        Render a tile of a pair.
+
+        Returns:
+        - tuple: (200, Tile) or (404, None) for a tile without data.
+        """
+        window = self.window(self.source(site, beam, pair), z, x, y)
+        if window is None:
+            return 404, None
+        phase = sample_tile(window, z, x, y)
+        if np.isnan(phase).all():
+            return 404, None
+        pixels = colorize(phase, self.lut)
+        content = encode_png(pixels.tobytes(), TILE_SIZE, TILE_SIZE)
+        with self._lock:
+            self.rendered += 1
+        return 200, Tile(content, tile_etag(content))
+
+    def load(self, site, beam, pair, z, x, y):
+        """
+        Return (status, Tile) of a rendered tile from the tile caches or
+        the raster, or None if the pair has no raster.
+        """
+        cache_key = tile_key(self.root, site, beam, pair, z, x, y)
+        known = cached_tile(cache_key)
+        if known is not None:
+            return known
+        if not self.has_pair(site, beam, pair):
+            return None
+        status, tile = self.render(site, beam, pair, int(z), int(x), int(y))
+        if status == 200:
+            tile_cache.put(cache_key, tile)
+        else:
+            tile_missing.add(cache_key)
+        return status, tile
+
+    def stats(self):
+        """Return counters and the raster window cache size."""
+        with self._lock:
+            rendered = self.rendered
+        return {
+            'root': self.root,
+            'rendered': rendered,
+            'windows': self.windows.stats(),
+            'reads': self._reads.stats(),
+        }
+
+
+tile_renderer = TileRenderer()
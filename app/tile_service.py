@@ -0,0 +1,179 @@
+#!/usr/bin/python3
+"""
+Volcano InSAR Interpretation Workbench
+
+Loading interferogram tiles from local archives, or from S3 through
+the tile caches
+
+SPDX-License-Identifier: MIT
+
+Copyright (C) 2021-2024 Government of Canada
+
+Authors:
+  - Drew Rotheram <drew.rotheram-clarke@nrcan-rncan.gc.ca>
+"""
+import logging
+import re
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+import requests
+from werkzeug.http import unquote_etag
+
+from global_variables import TILE_BATCH_WORKERS
+from tile_archive import tile_archive
+from tile_cache import Tile, tile_cache, tile_key, tile_missing
+from tile_client import tile_client, tile_flights
+from tile_footprint import tile_footprints
+from tile_signer import tile_signer
+
+logger = logging.getLogger(__name__)
+
+# statuses of a tile that does not exist
+MISSING_STATUS = (404,)
+# S3 answers 403 AccessDenied rather than 404 NoSuchKey for a missing key
+# when the role cannot list the bucket; other 403 codes (ExpiredToken,
+# SignatureDoesNotMatch...) are failures, not missing tiles
+MISSING_CODES = ('NoSuchKey', 'AccessDenied')
+
+_batch_executor = ThreadPoolExecutor(max_workers=TILE_BATCH_WORKERS,
+                                     thread_name_prefix='tile-batch')
+
+
+def tile_object_key(site, beam, pair, z, x, y):
+    """S3 key of a pair tile"""
+    return f"{site}/{beam}/{pair}/{z}/{x}/{y}.png"
+
+
+def get_signed_url(bucket, key, client_method='get_object'):
+    """Return a (cached) presigned url for a key"""
+    logger.debug("Bucket: %s",
+                 bucket)
+    url = tile_signer.url(bucket, key, client_method)
+    logger.debug("URL: %s",
+                 url)
+    return url
+
+
+def s3_etag(response):
+    """Unquoted ETag of an S3 response, or None"""
+    etag = response.headers.get('ETag')
+    return unquote_etag(etag)[0] if etag else None
+
+
+def s3_error_code(response):
+    """Code of an S3 error response, or None (e.g. for a HEAD request)."""
+    match = re.search(rb'<Code>([^<]+)</Code>', response.content or b'')
+    return match.group(1).decode('utf-8', 'replace') if match else None
+
+
+def is_missing(response):
+    """True if an S3 response shows the key does not exist."""
+    if response.status_code == 404:
+        return True
+    if response.status_code != 403:
+        return False
+    return s3_error_code(response) in MISSING_CODES
+
+
+def cached_tile(cache_key):
+    """
+    Return (status, Tile) for a tile known locally, or None.
+    Known missing tiles are (404, None).
+    """
+    if tile_missing.contains(cache_key):
+        return 404, None
+    tile = tile_cache.get(cache_key)
+    if tile is not None:
+        return 200, tile
+    return None
+
+
+def _fetch_tile(bucket, key, cache_key):
+    response = tile_client.get(get_signed_url(bucket, key))
+    if is_missing(response):
+        tile_missing.add(cache_key)
+        return 404, None
+    if response.status_code == 403:
+        # the url was rejected: sign again on the next request
+        tile_signer.forget(bucket, key)
+        logger.warning('S3 rejected the url of %s: %s', key,
+                       s3_error_code(response))
+        return 502, None
+    if response.status_code != 200:
+        return response.status_code, Tile(response.content, None)
+    tile = Tile(response.content, s3_etag(response))
+    tile_cache.put(cache_key, tile)
+    return response.status_code, tile
+
+
+def download_tile(bucket, key, cache_key):
+    """
+    Download a tile from S3 into the caches and return (status, Tile).
+    Concurrent downloads of the same tile share one upstream request.
+    """
+    return tile_flights.do(cache_key,
+                           partial(_fetch_tile, bucket, key, cache_key))
+
+
+def load_tile(bucket, site, beam, pair, z, x, y):
+    """
+    Return (status, Tile) of a pair tile, from its local archive, the
+    caches or S3.
+    """
+    if not tile_footprints.contains(site, z, x, y):
+        return 404, None
+    archived = tile_archive.load(site, beam, pair, z, x, y)
+    if archived is not None:
+        return archived
+    cache_key = tile_key(bucket, site, beam, pair, z, x, y)
+    known = cached_tile(cache_key)
+    if known is not None:
+        return known
+    return download_tile(bucket, tile_object_key(site, beam, pair, z, x, y),
+                         cache_key)
+
+
+def load_tiles(bucket, site, beam, pair, z, columns_rows):
+    """
+    Load many tiles of one pair at one zoom concurrently.
+
+    Tiles not cached locally are presigned together and downloaded in
+    parallel; tiles whose download fails are reported with status 502.
+
+    Parameters:
+    - columns_rows (iterable): (x, y) of the tiles to load.
+
+    Returns:
+    - dict: (x, y) -> (status, Tile or None)
+    """
+    if tile_archive.has_pair(site, beam, pair):
+        return {(x, y): tile_archive.load(site, beam, pair, z, x, y)
+                for x, y in columns_rows}
+    results = {}
+    missing = []
+    for x, y in columns_rows:
+        if not tile_footprints.contains(site, z, x, y):
+            results[(x, y)] = (404, None)
+            continue
+        known = cached_tile(tile_key(bucket, site, beam, pair, z, x, y))
+        if known is None:
+            missing.append((x, y))
+        else:
+            results[(x, y)] = known
+    if not missing:
+        return results
+    tile_signer.sign(bucket, [tile_object_key(site, beam, pair, z, x, y)
+                              for x, y in missing])
+    futures = {
+        (x, y): _batch_executor.submit(load_tile, bucket, site, beam, pair,
+                                       z, x, y)
+        for x, y in missing
+    }
+    for column_row, future in futures.items():
+        try:
+            results[column_row] = future.result()
+        except requests.exceptions.RequestException as exception:
+            logger.warning('Batch tile %s failed: %s', column_row, exception)
+            results[column_row] = (502, None)
+    return results
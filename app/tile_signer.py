@@ -0,0 +1,117 @@
+#!/usr/bin/python3
+"""
+Volcano InSAR Interpretation Workbench
+
+Cache of presigned S3 urls for interferogram tiles
+
+SPDX-License-Identifier: MIT
+
+Copyright (C) 2021-2024 Government of Canada
+
+Authors:
+  - Drew Rotheram <drew.rotheram-clarke@nrcan-rncan.gc.ca>
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from global_variables import (
+    TILE_URL_CACHE_ITEMS,
+    TILE_URL_EXPIRY,
+    TILE_URL_REFRESH_MARGIN,
+    s3
+)
+
+logger = logging.getLogger(__name__)
+
+
+class TileSigner:
+    """
+    Presign S3 tile urls and reuse them until they are close to expiry.
+
+    Keys signed in one call share an expiry, so a batch of tiles under one
+    pair prefix (e.g. a viewport) is presigned in a single pass and
+    refreshed together rather than tile by tile.
+
+    Parameters:
+    - client (botocore.client.S3): Client used to presign.
+    - expires_in (int): Lifetime of presigned urls in seconds.
+    - refresh_margin (int): Presign again when a cached url has fewer
+        seconds than this left.
+    - max_items (int): Number of cached urls.
+    """
+
+    def __init__(self, client, expires_in=TILE_URL_EXPIRY,
+                 refresh_margin=TILE_URL_REFRESH_MARGIN,
+                 max_items=TILE_URL_CACHE_ITEMS):
+        self.client = client
+        self.expires_in = expires_in
+        self.refresh_margin = refresh_margin
+        self.max_items = max_items
+        self._urls = OrderedDict()
+        self._lock = threading.Lock()
+        self.presigned = 0
+        self.reused = 0
+
+    def sign(self, bucket, keys, client_method='get_object'):
+        """
+        Return presigned urls for keys in bucket.
+
+        Returns:
+        - dict: key -> (url, expiry as a unix timestamp)
+        """
+        now = time.time()
+        signed = {}
+        missing = []
+        with self._lock:
+            for key in keys:
+                cached = self._urls.get((client_method, bucket, key))
+                if cached is None or cached[1] - now <= self.refresh_margin:
+                    missing.append(key)
+                    continue
+                self._urls.move_to_end((client_method, bucket, key))
+                signed[key] = cached
+                self.reused += 1
+        if not missing:
+            return signed
+        expires_at = now + self.expires_in
+        fresh = {
+            key: (self.client.generate_presigned_url(
+                client_method,
+                Params={'Bucket': bucket, 'Key': key},
+                ExpiresIn=self.expires_in
+            ), expires_at)
+            for key in missing
+        }
+        logger.debug('Presigned %s urls in %s', len(fresh), bucket)
+        with self._lock:
+            for key, value in fresh.items():
+                self._urls[(client_method, bucket, key)] = value
+            while len(self._urls) > self.max_items:
+                self._urls.popitem(last=False)
+            self.presigned += len(fresh)
+        signed.update(fresh)
+        return signed
+
+    def forget(self, bucket, key):
+        """Drop the cached urls of a key, e.g. after S3 rejected one."""
+        with self._lock:
+            for client_method in ('get_object', 'head_object'):
+                self._urls.pop((client_method, bucket, key), None)
+
+    def url(self, bucket, key, client_method='get_object'):
+        """Return a presigned url for a single key."""
+        return self.sign(bucket, [key], client_method)[key][0]
+
+    def stats(self):
+        """Return counters and current size."""
+        with self._lock:
+            return {
+                'items': len(self._urls),
+                'presigned': self.presigned,
+                'reused': self.reused,
+            }
+
+
+tile_signer = TileSigner(s3)
@@ -0,0 +1,137 @@
+#!/usr/bin/python3
+"""
+Volcano InSAR Interpretation Workbench
+
+Transcoding of interferogram tiles to smaller formats for slow links
+
+SPDX-License-Identifier: MIT
+
+Copyright (C) 2021-2024 Government of Canada
+
+Authors:
+  - Drew Rotheram <drew.rotheram-clarke@nrcan-rncan.gc.ca>
+"""
+import io
+import logging
+import threading
+
+from PIL import Image
+
+from global_variables import (
+    TILE_TRANSCODE,
+    TILE_TRANSCODE_COLORS,
+    TILE_TRANSCODE_QUALITY
+)
+from tile_cache import Tile, tile_cache
+from tile_client import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+
+def tile_mimetype(content):
+    """Content type of encoded tile bytes: WebP or PNG."""
+    if content[:4] == b'RIFF' and content[8:12] == b'WEBP':
+        return 'image/webp'
+    return 'image/png'
+
+
+def negotiate(accept_mimetypes, mode=TILE_TRANSCODE):
+    """
+    Pick the tile format for a client from its Accept header: WebP when
+    it is listed explicitly, palette PNG otherwise, or the stored PNG
+    when transcoding is off.
+
+    Parameters:
+    - accept_mimetypes (werkzeug.datastructures.MIMEAccept): The parsed
+        Accept header of the request.
+    - mode (str): 'none' or 'auto'.
+
+    Returns:
+    - str: 'webp', 'png8' or 'png' (as stored).
+    """
+    if mode != 'auto':
+        return 'png'
+    for mimetype, quality in accept_mimetypes:
+        if mimetype == 'image/webp' and quality > 0:
+            return 'webp'
+    return 'png8'
+
+
+def variant_etag(etag, output):
+    """ETag of a tile variant; the stored tile keeps its own ETag."""
+    if etag is None or output == 'png':
+        return etag
+    return f'{etag}-{output}'
+
+
+class TileTranscoder:
+    """
+    Encode tiles to WebP or palette-quantized PNG, once per tile.
+
+    Variants are kept in the tile caches under the ETag of the stored
+    tile, so a tile is encoded again only after its variant is evicted.
+    A variant that would not be smaller than the stored tile is replaced
+    by the stored bytes.
+
+    Parameters:
+    - cache (TileCache): Cache of encoded variants.
+    - quality (int): WebP quality, 0-100.
+    - colors (int): Palette size of quantized PNGs.
+    """
+
+    def __init__(self, cache=tile_cache, quality=TILE_TRANSCODE_QUALITY,
+                 colors=TILE_TRANSCODE_COLORS):
+        self.cache = cache
+        self.quality = quality
+        self.colors = colors
+        self._encodes = SingleFlight()
+        self._lock = threading.Lock()
+        self.counts = {'encoded': 0, 'bytes_in': 0, 'bytes_out': 0}
+
+    def _encode(self, tile, output):
+        image = Image.open(io.BytesIO(tile.content)).convert('RGBA')
+        encoded = io.BytesIO()
+        if output == 'webp':
+            image.save(encoded, format='WEBP', quality=self.quality,
+                       method=4)
+        else:
+            image.quantize(self.colors, method=Image.Quantize.FASTOCTREE
+                           ).save(encoded, format='PNG', optimize=True)
+        content = encoded.getvalue()
+        with self._lock:
+            self.counts['encoded'] += 1
+            self.counts['bytes_in'] += len(tile.content)
+            self.counts['bytes_out'] += min(len(content), len(tile.content))
+        if len(content) >= len(tile.content):
+            content = tile.content
+        return Tile(content, variant_etag(tile.etag, output))
+
+    def transcode(self, tile, output):
+        """
+        Return the tile in the output format ('webp' or 'png8').
+
+        Tiles without an ETag, and tiles that cannot be decoded, are
+        returned as stored.
+        """
+        if output == 'png' or tile.etag is None:
+            return tile
+        key = ('transcode', tile.etag, output)
+        variant = self.cache.get(key)
+        if variant is not None:
+            return variant
+        try:
+            variant = self._encodes.do(
+                key, lambda: self._encode(tile, output))
+        except (OSError, ValueError) as exception:
+            logger.warning('Tile transcoding failed: %s', exception)
+            return tile
+        self.cache.put(key, variant)
+        return variant
+
+    def stats(self):
+        """Return counters."""
+        with self._lock:
+            return dict(self.counts)
+
+
+tile_transcoder = TileTranscoder()
@@ -0,0 +1,96 @@
+#!/usr/bin/python3
+"""
+Volcano InSAR Interpretation Workbench
+
+Background warm-up of the data and figure caches at server start
+
+SPDX-License-Identifier: MIT
+
+Copyright (C) 2021-2024 Government of Canada
+
+Authors:
+  - Drew Rotheram <drew.rotheram-clarke@nrcan-rncan.gc.ca>
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from global_variables import WARMUP_WORKERS
+
+logger = logging.getLogger(__name__)
+
+
+class DataWarmup:
+    """
+    Run warm-up tasks for every target on a bounded thread pool, from a
+    daemon thread so the server accepts requests meanwhile.
+
+    Parameters:
+    - workers (int): Targets warmed concurrently; 0 disables warm-up.
+    """
+
+    def __init__(self, workers=WARMUP_WORKERS):
+        self.workers = workers
+        self._lock = threading.Lock()
+        self._timings = {}
+        self._started = None
+        self._finished = None
+
+    def start(self, targets, tasks):
+        """
+        Warm up targets in the background.
+
+        Parameters:
+        - targets (list): Target IDs, '{site}_{beam}'.
+        - tasks (dict): Name to function(target_id) of each warm-up step,
+            run in order for each target.
+        """
+        if self.workers <= 0 or not targets:
+            return
+        thread = threading.Thread(target=self._run, args=(targets, tasks),
+                                  name='data-warmup', daemon=True)
+        thread.start()
+
+    def _run(self, targets, tasks):
+        self._started = time.monotonic()
+        with ThreadPoolExecutor(self.workers,
+                                thread_name_prefix='data-warmup') as pool:
+            for target_id in targets:
+                pool.submit(self._warm, target_id, tasks)
+        self._finished = time.monotonic()
+        logger.info('Warmed up %d targets in %.1f s', len(targets),
+                    self._finished - self._started)
+
+    def _warm(self, target_id, tasks):
+        timings = {}
+        for name, task in tasks.items():
+            start = time.monotonic()
+            try:
+                task(target_id)
+            except Exception:  # pylint: disable=broad-exception-caught
+                # best effort: the target is loaded again when selected
+                logger.exception('Warm-up of %s %s failed', target_id, name)
+                timings[name] = None
+                continue
+            timings[name] = round((time.monotonic() - start) * 1000, 1)
+        with self._lock:
+            self._timings[target_id] = timings
+        logger.info('Warmed up %s: %s ms', target_id, timings)
+
+    def stats(self):
+        """Return per-target timings (ms, None if failed) and progress."""
+        with self._lock:
+            timings = dict(self._timings)
+        elapsed = None
+        if self._started is not None:
+            end = self._finished or time.monotonic()
+            elapsed = round(end - self._started, 1)
+        return {
+            'done': self._finished is not None,
+            'elapsed_s': elapsed,
+            'targets': timings,
+        }
+
+
+data_warmup = DataWarmup()
@@ -0,0 +1,133 @@
+#!/usr/bin/python3
+"""
+Volcano InSAR Interpretation Workbench
+
+Benchmark building the interferogram network lines of the baseline plot
+on a synthetic network, comparing the previous merges and iterrows loop
+with building the BaselineNetwork and its baseline_edges, and check
+that both give the same segments.
+
+SPDX-License-Identifier: MIT
+
+Copyright (C) 2021-2024 Government of Canada
+
+Authors:
+  - Drew Rotheram <drew.rotheram-clarke@nrcan-rncan.gc.ca>
+"""
+import argparse
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+from benchmark_coherence_dates import best_of, synthetic_coherence
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                             '..', 'app')))
+from baseline_network import BaselineNetwork
+from data_utils import baseline_edges
+
+
+def synthetic_baseline(coh, seed=0):
+    """Perpendicular baseline of every acquisition of a network."""
+    rng = np.random.default_rng(seed)
+    dates = np.union1d(coh.first_date.unique(), coh.second_date.unique())
+    return pd.DataFrame({
+        'first_date': dates[0],
+        'second_date': dates,
+        'bperp': rng.normal(0, 50, len(dates)),
+    })
+
+
+def iterrows_edges(df_baseline, df_cohfull):
+    """The previous implementation, without the gaps between segments."""
+    df_baseline_edge = df_cohfull[df_cohfull['coherence'].notna()]
+    df_baseline_edge = df_baseline_edge.drop(columns=['coherence'])
+    df_baseline_edge = pd.merge(df_baseline_edge,
+                                df_baseline[['second_date', 'bperp']],
+                                right_on='second_date',
+                                left_on='first_date',
+                                how='left')
+    df_baseline_edge = df_baseline_edge.drop(columns=['second_date_y'])
+    df_baseline_edge = df_baseline_edge.rename(
+        columns={"second_date_x": "second_date",
+                 "bperp": "bperp_reference_date"})
+    df_baseline_edge = pd.merge(df_baseline_edge,
+                                df_baseline[['second_date', 'bperp']],
+                                right_on='second_date',
+                                left_on='second_date',
+                                how='left')
+    df_baseline_edge = df_baseline_edge.rename(
+        columns={"bperp": "bperp_pair_date"})
+    df_baseline_edge = df_baseline_edge[
+        df_baseline_edge['bperp_reference_date'].notna()]
+    edge_x = []
+    edge_y = []
+    for _, edge in df_baseline_edge.iterrows():
+        edge_x.append(edge['first_date'])
+        edge_x.append(edge['second_date'])
+        edge_y.append(edge['bperp_reference_date'])
+        edge_y.append(edge['bperp_pair_date'])
+    return edge_x, edge_y
+
+
+def same_segments(expected, result):
+    """Check the segments match the previous points, gaps aside."""
+    edge_x, edge_y = result
+    points = np.ones(len(edge_x), dtype=bool)
+    points[2::3] = False
+    expected_x = pd.DatetimeIndex(expected[0]).strftime('%Y-%m-%d')
+    if list(expected_x) != list(edge_x[points]):
+        return False
+    return np.allclose(expected[1], edge_y[points], equal_nan=True)
+
+
+def main():
+    """Run the benchmark."""
+    args = parse_args()
+    coh = synthetic_coherence(args.years, args.repeat_days,
+                              args.max_baseline_days,
+                              missing=args.missing)
+    coh = coh.drop(columns=['delta_days'])
+    baseline = synthetic_baseline(coh)
+    print(f'{coh.coherence.count()} processed pairs, '
+          f'{len(baseline)} acquisitions')
+    loop_ms, expected = best_of(lambda: iterrows_edges(baseline, coh),
+                                args.repeat)
+    build_ms, network = best_of(lambda: BaselineNetwork.build(baseline, coh),
+                                args.repeat)
+    array_ms, result = best_of(lambda: baseline_edges(network), args.repeat)
+    print(f'merges + iterrows: {loop_ms:8.1f} ms')
+    print(f'network build:     {build_ms:8.1f} ms (once per sync)')
+    print(f'baseline_edges:    {array_ms:8.1f} ms '
+          f'({loop_ms / array_ms:.0f}x faster)')
+    print(network.stats())
+    if not same_segments(expected, result):
+        sys.exit('Network segments differ')
+
+
+def parse_args():
+    """
+    Parse command-line arguments.
+
+    Returns:
+        argparse.Namespace: An object containing the parsed arguments.
+    """
+    parser = argparse.ArgumentParser(
+        description="Benchmark the baseline plot network lines")
+    parser.add_argument("--years", type=float, default=8,
+                        help="Length of the acquisition record")
+    parser.add_argument("--repeat-days", type=int, default=4,
+                        help="Days between acquisitions")
+    parser.add_argument("--max-baseline-days", type=int, default=365,
+                        help="Longest temporal baseline of a pair")
+    parser.add_argument("--missing", type=float, default=0.5,
+                        help="Fraction of the pairs not processed")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="Runs of each implementation (best is kept)")
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    main()
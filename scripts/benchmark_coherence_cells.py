@@ -0,0 +1,102 @@
+#!/usr/bin/python3
+"""
+Volcano InSAR Interpretation Workbench
+
+Compare the dense coherence matrix heatmap with the one built from the
+sparse cells of sparse_and_clean on a synthetic record: size of the
+trace JSON sent to the browser and time to build it, and check that
+both give the same grid and values.
+
+SPDX-License-Identifier: MIT
+
+Copyright (C) 2021-2024 Government of Canada
+
+Authors:
+  - Drew Rotheram <drew.rotheram-clarke@nrcan-rncan.gc.ca>
+"""
+import argparse
+import os
+import sys
+
+import numpy as np
+import plotly.graph_objects as go
+
+from benchmark_coherence_dates import (
+    best_of,
+    pivot_and_clean,
+    pivot_and_clean_dates,
+    synthetic_coherence
+)
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                             '..', 'app')))
+from data_utils import heatmap_cells, sparse_and_clean
+
+
+def dense_trace(coh_long):
+    """JSON of the heatmap trace built from the dense matrices."""
+    coh_wide = pivot_and_clean(coh_long)
+    date_wide = pivot_and_clean_dates(coh_long, coh_wide)
+    return go.Heatmap(z=coh_wide.values, x=coh_wide.columns,
+                      y=coh_wide.index, customdata=date_wide).to_plotly_json()
+
+
+def sparse_trace(coh_long):
+    """JSON of the heatmap trace built from the sparse cells."""
+    cells = heatmap_cells(sparse_and_clean(coh_long, 'coherence'))
+    return go.Heatmap(**cells).to_plotly_json()
+
+
+def same_grid(coh_long):
+    """Check the cells pivot back to the dense matrix."""
+    coh_wide = pivot_and_clean(coh_long)
+    cells = sparse_and_clean(coh_long, 'coherence')
+    grid = cells.pivot_table(index='delta_days', columns='second_date',
+                             values='value', dropna=False)
+    grid = grid.reindex(index=coh_wide.index, columns=coh_wide.columns)
+    same_rows = set(cells.delta_days) == set(coh_wide.index)
+    same_cols = set(cells.second_date) == set(coh_wide.columns)
+    return same_rows and same_cols and np.allclose(
+        grid.to_numpy(), coh_wide.to_numpy(), equal_nan=True)
+
+
+def main():
+    """Run the benchmark."""
+    args = parse_args()
+    coh_long = synthetic_coherence(args.years, args.repeat_days,
+                                   args.max_baseline_days,
+                                   missing=args.missing)
+    print(f'{len(coh_long)} pairs, {coh_long.coherence.count()} processed')
+    for name, build in (('dense', dense_trace), ('sparse', sparse_trace)):
+        elapsed, trace = best_of(lambda build=build: build(coh_long),
+                                 args.repeat)
+        size = len(go.Figure(trace).to_json())
+        print(f'{name:7s} {elapsed:8.1f} ms {size / 1e6:8.2f} MB')
+    if not same_grid(coh_long):
+        sys.exit('Sparse cells differ from the dense matrix')
+
+
+def parse_args():
+    """
+    Parse command-line arguments.
+
+    Returns:
+        argparse.Namespace: An object containing the parsed arguments.
+    """
+    parser = argparse.ArgumentParser(
+        description="Compare dense and sparse coherence heatmaps")
+    parser.add_argument("--years", type=float, default=5,
+                        help="Length of the acquisition record")
+    parser.add_argument("--repeat-days", type=int, default=4,
+                        help="Days between acquisitions")
+    parser.add_argument("--max-baseline-days", type=int, default=3 * 365,
+                        help="Longest temporal baseline of a pair")
+    parser.add_argument("--missing", type=float, default=0.9,
+                        help="Fraction of the pairs not processed")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="Runs of each implementation (best is kept)")
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    main()
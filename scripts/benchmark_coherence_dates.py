@@ -0,0 +1,173 @@
+#!/usr/bin/python3
+"""
+Volcano InSAR Interpretation Workbench
+
+Benchmark building the hover date matrix of the coherence plot on a
+synthetic record, comparing the previous per-cell strftime map with
+factorized date labels, and check that both give the same matrix.
+pivot_and_clean and pivot_and_clean_dates are the dense matrices the
+plot was built from before data_utils.sparse_and_clean, kept here as
+the reference for the benchmarks.
+
+SPDX-License-Identifier: MIT
+
+Copyright (C) 2021-2024 Government of Canada
+
+Authors:
+  - Drew Rotheram <drew.rotheram-clarke@nrcan-rncan.gc.ca>
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                             '..', 'app')))
+from data_utils import _date_labels
+from global_variables import COH_DECIMALS
+
+
+def synthetic_coherence(years, repeat_days, max_baseline_days, seed=0,
+                        missing=0.1):
+    """
+    Long-form coherence of every pair up to max_baseline_days apart in a
+    record of acquisitions every repeat_days, with a missing fraction of
+    the pairs not processed.
+    """
+    rng = np.random.default_rng(seed)
+    count = int(years * 365.25 / repeat_days)
+    dates = pd.date_range('2020-01-01', periods=count,
+                          freq=f'{repeat_days}D')
+    first, second = np.triu_indices(len(dates), k=1)
+    keep = (second - first) * repeat_days <= max_baseline_days
+    coh = pd.DataFrame({
+        'first_date': dates[first[keep]],
+        'second_date': dates[second[keep]],
+        'coherence': rng.uniform(0, 1, keep.sum()),
+    })
+    coh.loc[rng.uniform(0, 1, len(coh)) < missing, 'coherence'] = np.nan
+    coh['delta_days'] = (coh.second_date - coh.first_date).dt.days
+    return coh
+
+
+def pivot_and_clean(coh_long):
+    """Convert long-form coherence to wide-form and clean it up."""
+    coh_wide = coh_long.pivot(
+        index='delta_days',
+        columns='second_date',
+        values='coherence')
+    # include zero baseline even though it will never be valid
+    coh_wide.loc[0, :] = np.NaN
+    coh_wide.sort_index(inplace=True)
+    # because hovertemplate 'f' format doesn't handle NaN properly
+    coh_wide = coh_wide.round(COH_DECIMALS)
+
+    cw_last_col = coh_wide.max(axis='columns').last_valid_index()
+    cw_first_ind = coh_wide.max(axis='index').first_valid_index()
+    cw_last_ind = coh_wide.max(axis='index').last_valid_index()
+    cw_col = coh_wide.columns
+    # trim empty edges
+    coh_wide = coh_wide.loc[
+        (coh_wide.index >= 0) & (coh_wide.index <= cw_last_col),
+        (cw_col >= cw_first_ind) & (cw_col <= cw_last_ind)
+    ]
+    return coh_wide
+
+
+def pivot_and_clean_dates(coh_long, coh_wide):
+    """Convert long-form df to wide-form date matrix matching coh_wide."""
+    coh_long = coh_long.drop(
+        coh_long[coh_long.second_date < coh_long.first_date].index
+    )
+    # format each distinct first date once and pivot integer codes into
+    # the labels, rather than formatting every cell of the matrix
+    codes, labels = _date_labels(coh_long.first_date)
+    code_wide = coh_long.assign(code=codes).pivot(
+        index='delta_days',
+        columns='second_date',
+        values='code')
+    # missing cells (NaN, or -1 for a missing first date) take the NaT
+    # at the end of labels
+    date_wide = pd.DataFrame(
+        labels[code_wide.fillna(-1).to_numpy(dtype=np.intp)],
+        index=code_wide.index,
+        columns=code_wide.columns)
+    # keep the columns of coh_wide; note the rows are not aligned with
+    # it, which put the wrong start dates in the dense plot's hover
+    common_cols = list(set(date_wide.columns).intersection(coh_wide.columns))
+    common_cols.sort()
+    return date_wide[common_cols]
+
+
+def map_dates(coh_long, coh_wide):
+    """The previous implementation, formatting every cell."""
+    coh_long = coh_long.drop(
+        coh_long[coh_long.second_date < coh_long.first_date].index
+    )
+    date_wide = coh_long.pivot(
+        index='delta_days',
+        columns='second_date',
+        values='first_date')
+    date_wide = date_wide.map(lambda x: pd.to_datetime(x)
+                              .strftime('%b %d, %Y') if x is not pd.NaT
+                              else x)
+    common_cols = list(set(date_wide.columns).intersection(coh_wide.columns))
+    common_cols.sort()
+    return date_wide[common_cols]
+
+
+def best_of(function, repeat):
+    """Best wall time in ms of repeat calls, and the last result."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000, result
+
+
+def main():
+    """Run the benchmark."""
+    args = parse_args()
+    coh_long = synthetic_coherence(args.years, args.repeat_days,
+                                   args.max_baseline_days)
+    coh_wide = pivot_and_clean(coh_long)
+    print(f'{len(coh_long)} pairs, matrix '
+          f'{coh_wide.shape[0]} x {coh_wide.shape[1]}')
+    map_ms, expected = best_of(lambda: map_dates(coh_long, coh_wide),
+                               args.repeat)
+    codes_ms, result = best_of(
+        lambda: pivot_and_clean_dates(coh_long, coh_wide), args.repeat)
+    print(f'per-cell map:   {map_ms:8.1f} ms')
+    print(f'factorized:     {codes_ms:8.1f} ms '
+          f'({map_ms / codes_ms:.0f}x faster)')
+    same = expected.fillna('').equals(result.fillna(''))
+    if not same or not expected.isna().equals(result.isna()):
+        sys.exit('Date matrices differ')
+
+
+def parse_args():
+    """
+    Parse command-line arguments.
+
+    Returns:
+        argparse.Namespace: An object containing the parsed arguments.
+    """
+    parser = argparse.ArgumentParser(
+        description="Benchmark the coherence plot hover date matrix")
+    parser.add_argument("--years", type=float, default=5,
+                        help="Length of the acquisition record")
+    parser.add_argument("--repeat-days", type=int, default=4,
+                        help="Days between acquisitions")
+    parser.add_argument("--max-baseline-days", type=int, default=3 * 365,
+                        help="Longest temporal baseline of a pair")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="Runs of each implementation (best is kept)")
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,170 @@
+#!/usr/bin/python3
+"""
+Volcano InSAR Interpretation Workbench
+
+Benchmark syncing a synthetic coherence record and then the pairs of a
+few new acquisitions through the sync steps (columnar conversion and
+coherence store ingest) and the first read after the sync, compared
+with re-parsing the whole CoherenceMatrix.csv, and check that the store
+holds the same pairs as the file.
+
+SPDX-License-Identifier: MIT
+
+Copyright (C) 2021-2024 Government of Canada
+
+Authors:
+  - Drew Rotheram <drew.rotheram-clarke@nrcan-rncan.gc.ca>
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from benchmark_coherence_dates import synthetic_coherence
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                             '..', 'app')))
+from coherence_store import CoherenceStore, coherence_stores, state_frame
+from compact_pairs import CompactPairs, to_float32
+from data_utils import (
+    _coherence_csv,
+    _parse_coherence,
+    _read_columnar,
+    _store_dir,
+    convert_to_columnar,
+    ingest_coherence
+)
+
+# a target of its own, synced in a temporary directory
+TARGET = 'Benchmark_B1'
+
+
+def timed(function):
+    """Wall time in ms of one call, and its result."""
+    start = time.perf_counter()
+    result = function()
+    return (time.perf_counter() - start) * 1000, result
+
+
+def write_csv(frame, path):
+    """Write pairs as a CoherenceMatrix.csv."""
+    frame.rename(columns={'first_date': 'Reference Date',
+                          'second_date': 'Pair Date',
+                          'coherence': 'Coherence'}).to_csv(path,
+                                                            index=False)
+
+
+def run_sync(history, full):
+    """
+    Sync a target in the current directory as convert_latest_csv does,
+    from history then full, timing each step of the second sync and the
+    reads; returns the timings and the final state.
+    """
+    coherence_csv = _coherence_csv(TARGET)
+    os.makedirs(os.path.dirname(coherence_csv))
+    write_csv(history, coherence_csv)
+    convert_to_columnar(TARGET)
+    ingest_coherence(TARGET)
+    store_dir = _store_dir(coherence_csv)
+    state = coherence_stores.current(store_dir, coherence_csv)
+
+    write_csv(full, coherence_csv)
+    timings = {}
+    timings['CSV to Feather'], _ = timed(
+        lambda: convert_to_columnar(TARGET))
+    timings['ingest'], _ = timed(lambda: ingest_coherence(TARGET))
+    timings['delta load'], state = timed(
+        lambda: coherence_stores.current(store_dir, coherence_csv))
+    timings['full store load'], _ = timed(
+        CoherenceStore(store_dir).load)
+    return timings, state
+
+
+def same_pairs(full, state):
+    """Check the store holds the pairs of the file."""
+    expected = full.sort_values(['first_date', 'second_date'],
+                                kind='stable').reset_index(drop=True)
+    result = state_frame(state)
+    if not expected[['first_date', 'second_date']].equals(
+            result[['first_date', 'second_date']]):
+        return False
+    expected_values = to_float32(expected.coherence.to_numpy())
+    return np.array_equal(expected_values,
+                          result.coherence.to_numpy(dtype=np.float32),
+                          equal_nan=True)
+
+
+def main():
+    """Run the benchmark."""
+    args = parse_args()
+    full = synthetic_coherence(args.years, args.repeat_days,
+                               args.max_baseline_days)
+    full = full.drop(columns=['delta_days'])
+    last = full.second_date.max()
+    cutoff = last - np.timedelta64(args.new_acquisitions * args.repeat_days,
+                                   'D')
+    history = full.loc[full.second_date <= cutoff].reset_index(drop=True)
+    print(f'{len(history)} pairs in the record, '
+          f'{len(full) - len(history)} new')
+
+    cwd = os.getcwd()
+    best = {}
+    try:
+        for _ in range(args.repeat):
+            with tempfile.TemporaryDirectory() as directory:
+                os.chdir(directory)
+                timings, state = run_sync(history, full)
+                timings['CSV parse'], _ = timed(
+                    lambda: CompactPairs.from_frame(_parse_coherence(
+                        _coherence_csv(TARGET)), 'coherence'))
+                timings['Feather read'], _ = timed(
+                    lambda: CompactPairs.from_frame(_read_columnar(
+                        _coherence_csv(TARGET), 'coherence'), 'coherence'))
+                os.chdir(cwd)
+            for name, value in timings.items():
+                best[name] = min(best.get(name, float('inf')), value)
+    finally:
+        os.chdir(cwd)
+
+    print('sync of a changed file (both grow with the whole record):')
+    print(f'  CSV to Feather:   {best["CSV to Feather"]:8.1f} ms')
+    print(f'  ingest:           {best["ingest"]:8.1f} ms '
+          '(reads the Feather copy, diffs every pair, writes the delta)')
+    print('first read after the sync:')
+    print(f'  CSV parse:        {best["CSV parse"]:8.1f} ms')
+    print(f'  Feather read:     {best["Feather read"]:8.1f} ms '
+          '(what a reader did before the store)')
+    print(f'  full store load:  {best["full store load"]:8.1f} ms')
+    print(f'  delta load:       {best["delta load"]:8.1f} ms '
+          '(a loaded store reads only the new segment)')
+    if not same_pairs(full, state):
+        sys.exit('Store pairs differ')
+
+
+def parse_args():
+    """
+    Parse command-line arguments.
+
+    Returns:
+        argparse.Namespace: An object containing the parsed arguments.
+    """
+    parser = argparse.ArgumentParser(
+        description="Benchmark incremental coherence ingestion")
+    parser.add_argument("--years", type=float, default=8,
+                        help="Length of the acquisition record")
+    parser.add_argument("--repeat-days", type=int, default=4,
+                        help="Days between acquisitions")
+    parser.add_argument("--max-baseline-days", type=int, default=365,
+                        help="Longest temporal baseline of a pair")
+    parser.add_argument("--new-acquisitions", type=int, default=2,
+                        help="Acquisitions added since the last sync")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="Runs of each step (best is kept)")
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    main()
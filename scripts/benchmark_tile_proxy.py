@@ -0,0 +1,154 @@
+#!/usr/bin/python3
+"""
+Volcano InSAR Interpretation Workbench
+
+Benchmark per-tile latency of the tile proxy upstream client, comparing
+a bare requests.get per tile against the pooled keep-alive client, and
+check that concurrent identical /getTileUrl requests reach upstream
+only once.
+
+SPDX-License-Identifier: MIT
+
+Copyright (C) 2021-2024 Government of Canada
+
+Authors:
+  - Drew Rotheram <drew.rotheram-clarke@nrcan-rncan.gc.ca>
+"""
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+
+import requests
+from flask import Flask
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                             '..', 'app')))
+from global_variables import TILE_MODE
+from routes import add_routes
+from tile_client import TileClient
+from tile_signer import tile_signer
+from tile_standin import TileStandin
+
+
+def time_tiles(get, base_url, count):
+    """Fetch count tiles with get() and return latencies in ms"""
+    latencies = []
+    for i in range(count):
+        start = time.perf_counter()
+        get(f'{base_url}/Meager/5M3/20220821_20220914/12/{i}/0.png')
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def report(label, latencies):
+    """Print a latency summary"""
+    latencies = sorted(latencies)
+    p95 = latencies[int(0.95 * (len(latencies) - 1))]
+    print(f'{label:>8}: mean {statistics.mean(latencies):7.2f} ms  '
+          f'median {statistics.median(latencies):7.2f} ms  '
+          f'p95 {p95:7.2f} ms')
+
+
+class StandinPresigner:  # pylint: disable=too-few-public-methods
+    """Presign tile urls on the stand-in instead of S3"""
+
+    def __init__(self, base_url):
+        self.base_url = base_url
+
+    def generate_presigned_url(self, _client_method, **kwargs):
+        """Url of the key on the stand-in, whatever the client method"""
+        return f'{self.base_url}/{kwargs["Params"]["Key"]}'
+
+
+def coalesced_hits(standin, concurrent):
+    """
+    Fire concurrent identical /getTileUrl requests at the app, with the
+    tile signer pointed at the stand-in, and return the number of
+    requests that reached the stand-in.
+    """
+    if TILE_MODE != 'proxy':
+        sys.exit('Coalescing needs TILE_MODE=proxy')
+    server = Flask(__name__)
+    add_routes(server)
+    tile_signer.client = StandinPresigner(standin.url)
+    # a pair of its own, so the tile is in neither cache
+    query = {'site': 'Benchmark', 'beam': 'B1', 'startdate': '20220821',
+             'enddate': str(time.time_ns()), 'bucket': 'benchmark',
+             'z': 12, 'x': 0, 'y': 0}
+    barrier = threading.Barrier(concurrent)
+    statuses = []
+
+    def fetch():
+        client = server.test_client()
+        barrier.wait()
+        statuses.append(client.get('/getTileUrl',
+                                   query_string=query).status_code)
+
+    hits = standin.hits
+    threads = [threading.Thread(target=fetch) for _ in range(concurrent)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if statuses != [200] * concurrent:
+        sys.exit(f'Unexpected /getTileUrl statuses: {sorted(set(statuses))}')
+    return standin.hits - hits
+
+
+def main():
+    """Run the benchmark against a local S3 stand-in"""
+    args = parse_args()
+    standin = TileStandin(args.handshake_ms, args.latency_ms).start()
+
+    bare = time_tiles(
+        lambda url: requests.get(url, timeout=10, verify=False),
+        standin.url, args.tiles)
+    bare_connections = standin.connections
+
+    client = TileClient(pool_size=args.pool_size)
+    pooled = time_tiles(client.get, standin.url, args.tiles)
+
+    report('before', bare)
+    report('after', pooled)
+    print(f'connections opened: before {bare_connections}, '
+          f'after {standin.connections - bare_connections}')
+    print(client.stats())
+
+    # slow the stand-in down so the concurrent requests overlap
+    standin.latency_ms = max(args.latency_ms, 50.)
+    hits = coalesced_hits(standin, args.concurrent)
+    print(f'upstream hits for {args.concurrent} concurrent identical '
+          f'requests: {hits}')
+    standin.shutdown()
+    if hits != 1:
+        sys.exit('Concurrent identical tile requests were not coalesced')
+
+
+def parse_args():
+    """
+    Parse command-line arguments.
+
+    Returns:
+        argparse.Namespace: An object containing the parsed arguments.
+    """
+    parser = argparse.ArgumentParser(
+        description="Benchmark per-tile latency of the tile proxy client")
+    parser.add_argument("--tiles", type=int, default=200,
+                        help="Number of tiles to fetch")
+    parser.add_argument("--handshake-ms", type=float, default=20.,
+                        help="Delay per new connection (stands in for "
+                             "the TCP+TLS handshake with S3)")
+    parser.add_argument("--latency-ms", type=float, default=0.,
+                        help="Delay per request")
+    parser.add_argument("--pool-size", type=int, default=16,
+                        help="Pooled client connections per host")
+    parser.add_argument("--concurrent", type=int, default=20,
+                        help="Concurrent identical requests to coalesce")
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    main()
@@ -17,6 +17,50 @@ import botocore.exceptions
 from scripts_config import get_config_params, s3
 
 
+def _read_etag(path):
+    try:
+        with open(path, encoding="utf-8") as etag_file:
+            return etag_file.read().strip()
+    except OSError:
+        return None
+
+
+def download_if_changed(bucket, key, filename):
+    """
+    Download an object unless the ETag recorded next to filename shows
+    it is unchanged, so an unchanged file keeps its modification time
+    and nothing downstream is rebuilt from it.
+
+    Parameters:
+    - bucket (str): The S3 bucket.
+    - key (str): The object key.
+    - filename (str): The local file; its ETag is kept in filename.etag.
+
+    Returns:
+    - bool: True if the file was downloaded, False if it was unchanged.
+    """
+    etag_path = f'{filename}.etag'
+    etag = _read_etag(etag_path) if os.path.exists(filename) else None
+    request = {'Bucket': bucket, 'Key': key}
+    if etag:
+        request['IfNoneMatch'] = etag
+    try:
+        response = s3.get_object(**request)
+    except botocore.exceptions.ClientError as error:
+        code = error.response.get('Error', {}).get('Code')
+        if code in ('304', 'NotModified'):
+            return False
+        raise
+    tmp_path = f'{filename}.tmp'
+    with open(tmp_path, 'wb') as tmp_file:
+        for chunk in response['Body'].iter_chunks():
+            tmp_file.write(chunk)
+    os.replace(tmp_path, filename)
+    with open(etag_path, 'w', encoding="utf-8") as etag_file:
+        etag_file.write(response.get('ETag', ''))
+    return True
+
+
 def get_latest_coh_matrices():
     '''Main function, retrieve latest coherence
     matrix files for all site/beam combos'''
@@ -31,11 +75,11 @@ def get_latest_coh_matrices():
             if not os.path.exists(f'app/Data/{site}/{beam}'):
                 os.makedirs(f'app/Data/{site}/{beam}')
             try:
-                s3.download_file(
-                    Bucket=config['AWS_BUCKET_NAME'],
-                    Key=f'{site}/{beam}/CoherenceMatrix.csv',
-                    Filename=f'app/Data/{site}/{beam}/CoherenceMatrix.csv'
-                )
+                if not download_if_changed(
+                        config['AWS_BUCKET_NAME'],
+                        f'{site}/{beam}/CoherenceMatrix.csv',
+                        f'app/Data/{site}/{beam}/CoherenceMatrix.csv'):
+                    print('CoherenceMatrix.csv unchanged')
             except botocore.exceptions.ClientError:
                 print('CoherenceMatrix.csv File not found')
     logging.info('DONE get_latest_coh_matrices')
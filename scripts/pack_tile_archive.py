@@ -0,0 +1,119 @@
+#!/usr/bin/python3
+"""
+Volcano InSAR Interpretation Workbench
+
+Pack the tile pyramid of interferogram pairs from the tiles bucket into
+local MBTiles archives ({site}/{beam}/{pair}.mbtiles) that the workbench
+serves without network access.
+
+SPDX-License-Identifier: MIT
+
+Copyright (C) 2021-2024 Government of Canada
+
+Authors:
+  - Drew Rotheram <drew.rotheram-clarke@nrcan-rncan.gc.ca>
+"""
+import argparse
+import logging
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                             '..', 'app')))
+from global_variables import TILE_ARCHIVE_DIR
+from scripts_config import get_config_params, s3
+from tile_archive import tile_archive, write_archive
+from tile_inventory import tile_bounds
+
+
+def list_tiles(bucket, prefix):
+    """Return (z, x, y, key) of every png tile under prefix."""
+    tiles = []
+    paginator = s3.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+        for obj in page.get('Contents', []):
+            parts = obj['Key'][len(prefix):].split('/')
+            if len(parts) != 3 or not parts[2].endswith('.png'):
+                continue
+            z, x, y = parts[0], parts[1], parts[2][:-4]
+            if z.isdigit() and x.isdigit() and y.isdigit():
+                tiles.append((int(z), int(x), int(y), obj['Key']))
+    return tiles
+
+
+def archive_metadata(site, beam, pair, tiles):
+    """MBTiles metadata of a pair, with bounds from its lowest zoom."""
+    min_zoom = min(z for z, _, _, _ in tiles)
+    lowest = [(x, y) for z, x, y, _ in tiles if z == min_zoom]
+    xs, ys = zip(*lowest)
+    south, west, _, _ = tile_bounds(min_zoom, min(xs), min(ys))
+    _, _, north, east = tile_bounds(min_zoom, max(xs), max(ys))
+    return {
+        'name': f'{site}/{beam}/{pair}',
+        'format': 'png',
+        'type': 'overlay',
+        'minzoom': min_zoom,
+        'maxzoom': max(z for z, _, _, _ in tiles),
+        'bounds': f'{west},{south},{east},{north}',
+    }
+
+
+def pack_pair(bucket, site, beam, pair, workers):
+    """Download the tiles of a pair and write its archive."""
+    path = tile_archive.path(site, beam, pair)
+    if path is None:
+        logging.error('Invalid pair name %s/%s/%s', site, beam, pair)
+        return
+    tiles = list_tiles(bucket, f'{site}/{beam}/{pair}/')
+    if not tiles:
+        logging.warning('No tiles found for %s/%s/%s', site, beam, pair)
+        return
+
+    def download(tile):
+        z, x, y, key = tile
+        response = s3.get_object(Bucket=bucket, Key=key)
+        return z, x, y, response['Body'].read()
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        write_archive(path, executor.map(download, tiles),
+                      archive_metadata(site, beam, pair, tiles))
+    logging.info('Packed %s tiles into %s (%.1f MB)', len(tiles), path,
+                 os.path.getsize(path) / 1024 / 1024)
+
+
+def main():
+    """Pack each requested pair."""
+    args = parse_args()
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s - %(levelname)s - %(message)s')
+    tile_archive.directory = args.output
+    for pair in args.pairs:
+        pack_pair(args.bucket, args.site, args.beam, pair, args.workers)
+
+
+def parse_args():
+    """
+    Parse command-line arguments.
+
+    Returns:
+        argparse.Namespace: An object containing the parsed arguments.
+    """
+    parser = argparse.ArgumentParser(
+        description="Pack interferogram tiles into local MBTiles archives")
+    parser.add_argument("site", help="Site name, e.g. Meager")
+    parser.add_argument("beam", help="Beam mode, e.g. 5M3")
+    parser.add_argument("pairs", nargs='+',
+                        help="Pairs to pack, as YYYYMMDD_YYYYMMDD")
+    parser.add_argument("--bucket",
+                        default=get_config_params()['AWS_TILES_URL'],
+                        help="Tiles bucket (default: AWS_TILES_URL)")
+    parser.add_argument("--output", default=TILE_ARCHIVE_DIR,
+                        help="Archive directory (default: TILE_ARCHIVE_DIR)")
+    parser.add_argument("--workers", type=int, default=16,
+                        help="Concurrent tile downloads")
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    main()
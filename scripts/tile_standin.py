@@ -0,0 +1,94 @@
+#!/usr/bin/python3
+"""
+Volcano InSAR Interpretation Workbench
+
+Local stand-in for the S3 tiles bucket, used by the tile benchmarks
+
+SPDX-License-Identifier: MIT
+
+Copyright (C) 2021-2024 Government of Canada
+
+Authors:
+  - Drew Rotheram <drew.rotheram-clarke@nrcan-rncan.gc.ca>
+"""
+import base64
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 1x1 transparent PNG
+TILE_PNG = base64.b64decode(
+    'iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNkYPhf'
+    'DwAChwGA60e6kgAAAABJRU5ErkJggg=='
+)
+
+
+class TileStandin(ThreadingHTTPServer):
+    """
+    Keep-alive HTTP server answering GETs with a PNG tile, or with a
+    404 for paths under one of missing_prefixes.
+
+    Parameters:
+    - handshake_ms (float): Delay added once per new connection, to
+        stand in for the TCP+TLS handshake with S3.
+    - latency_ms (float): Delay added to every request.
+    """
+    daemon_threads = True
+
+    def __init__(self, handshake_ms=0., latency_ms=0.):
+        super().__init__(('127.0.0.1', 0), _TileHandler)
+        self.handshake_ms = handshake_ms
+        self.latency_ms = latency_ms
+        self.missing_prefixes = ()
+        self.connections = 0
+        self.hits = 0
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        """Base url of the stand-in"""
+        return f'http://127.0.0.1:{self.server_address[1]}'
+
+    def start(self):
+        """Serve from a background thread and return self"""
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+class _TileHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+        time.sleep(self.server.handshake_ms / 1000)
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """Return the tile"""
+        with self.server.lock:
+            self.server.hits += 1
+        if self._send_headers():
+            self.wfile.write(TILE_PNG)
+
+    def do_HEAD(self):  # pylint: disable=invalid-name
+        """Return the tile headers"""
+        self._send_headers()
+
+    def _send_headers(self):
+        time.sleep(self.server.latency_ms / 1000)
+        if self.path.startswith(tuple(self.server.missing_prefixes)):
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return False
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/png')
+        self.send_header('Content-Length', str(len(TILE_PNG)))
+        self.send_header('ETag', '"standin"')
+        self.end_headers()
+        return True
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        pass